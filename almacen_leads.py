@@ -0,0 +1,159 @@
+import os
+from contextlib import contextmanager
+
+import pandas as pd
+
+from config_clientes import DIRECTORIO_DATOS
+from procesamiento import compactar_tipos
+from segmentacion import fechas_grupo
+
+# Directorio base del almacén incremental de leads procesados
+DIRECTORIO_ALMACEN = os.environ.get(
+    'SEGMENTACION_ALMACEN_DIR',
+    os.path.join(DIRECTORIO_DATOS, 'almacen')
+)
+
+# Columnas que identifican a un lead entre archivos y ejecuciones
+COLUMNAS_CLAVE = ['Email', 'Tel', 'Fecha_Lead']
+
+# Partición para los leads sin fecha reconocida
+PARTICION_SIN_FECHA = 'fecha=sin_fecha'
+
+# Archivo de bloqueo dentro del directorio de cada cliente
+ARCHIVO_BLOQUEO = '.bloqueo'
+
+def clave_lead(df: pd.DataFrame) -> pd.Series:
+    """Calcula una clave estable (hash de 64 bits) por lead."""
+    columnas = [col for col in COLUMNAS_CLAVE if col in df.columns]
+    return pd.util.hash_pandas_object(df[columnas], index=False)
+
+def nombre_particion(fecha) -> str:
+    """Obtiene el nombre de la partición de un día."""
+    return PARTICION_SIN_FECHA if pd.isna(fecha) else f"fecha={fecha:%Y-%m-%d}"
+
+def directorio_cliente(cliente_id: str, directorio: str = None) -> str:
+    """Obtiene el directorio del almacén de un cliente."""
+    return os.path.join(directorio or DIRECTORIO_ALMACEN, cliente_id)
+
+@contextmanager
+def bloquear_cliente(cliente_id: str, directorio: str = None):
+    """Bloquea el almacén del cliente entre procesos mientras se modifica.
+
+    Dos ejecuciones que leen, mezclan y reescriben la misma partición a la
+    vez perderían los leads de una de ellas; el bloqueo las hace esperar.
+    """
+    base = directorio_cliente(cliente_id, directorio)
+    os.makedirs(base, exist_ok=True)
+    with open(os.path.join(base, ARCHIVO_BLOQUEO), 'a+b') as f:
+        try:
+            import fcntl
+        except ImportError:
+            # Windows: LK_LOCK reintenta unos segundos y falla, así que se repite hasta obtenerlo
+            import msvcrt
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _leer_particion(ruta: str) -> pd.DataFrame:
+    """Lee una partición del almacén o devuelve None si no existe."""
+    archivo = os.path.join(ruta, 'leads.parquet')
+    return pd.read_parquet(archivo) if os.path.exists(archivo) else None
+
+def _escribir_particion(df: pd.DataFrame, ruta: str):
+    """Escribe una partición de forma atómica."""
+    os.makedirs(ruta, exist_ok=True)
+    archivo = os.path.join(ruta, 'leads.parquet')
+    temporal = f"{archivo}.{os.getpid()}.tmp"
+    df.to_parquet(temporal, index=False)
+    os.replace(temporal, archivo)
+
+def guardar_leads(df: pd.DataFrame, cliente_id: str, directorio: str = None) -> dict:
+    """Incorpora leads procesados al almacén particionado por día.
+
+    Los leads ya existentes (misma clave) se reemplazan por la versión nueva,
+    que trae la resolución más reciente. Las escrituras del mismo cliente se
+    hacen de a una (ver bloquear_cliente). Devuelve la cantidad de leads
+    nuevos y actualizados.
+    """
+    base = directorio_cliente(cliente_id, directorio)
+    resumen = {'nuevos': 0, 'actualizados': 0}
+    if df.empty:
+        return resumen
+
+    df = df.assign(Clave_Lead=clave_lead(df).to_numpy())
+    particiones = df['Fecha_Lead'].dt.normalize() if 'Fecha_Lead' in df.columns else pd.Series(pd.NaT, index=df.index)
+
+    with bloquear_cliente(cliente_id, directorio):
+        for fecha, df_dia in df.groupby(particiones, dropna=False, sort=False):
+            ruta = os.path.join(base, nombre_particion(fecha))
+            df_dia = df_dia.drop_duplicates(subset='Clave_Lead', keep='last')
+            existente = _leer_particion(ruta)
+
+            if existente is not None:
+                repetidos = df_dia['Clave_Lead'].isin(existente['Clave_Lead'])
+                resumen['actualizados'] += int(repetidos.sum())
+                resumen['nuevos'] += int((~repetidos).sum())
+                existente = existente[~existente['Clave_Lead'].isin(df_dia['Clave_Lead'])]
+                df_dia = pd.concat([existente, df_dia], ignore_index=True)
+            else:
+                resumen['nuevos'] += len(df_dia)
+
+            _escribir_particion(df_dia.reset_index(drop=True), ruta)
+
+    return resumen
+
+def version_almacen(cliente_id: str, directorio: str = None) -> int:
+    """Obtiene una marca que cambia cada vez que se reescribe una partición del cliente."""
+    base = directorio_cliente(cliente_id, directorio)
+    if not os.path.isdir(base):
+        return 0
+    archivos = (os.path.join(base, p, 'leads.parquet') for p in os.listdir(base) if p.startswith('fecha='))
+    return max((os.stat(archivo).st_mtime_ns for archivo in archivos if os.path.exists(archivo)), default=0)
+
+def dias_necesarios(grupos: list, fecha_referencia, fecha_hasta=None):
+    """Obtiene los días que deben leerse para segmentar los grupos.
+
+    Con fecha_hasta se cubren todas las fechas de referencia del rango.
+    Devuelve None si algún grupo no filtra por fecha y necesita todo el historial.
+    """
+    fechas = pd.date_range(pd.Timestamp(fecha_referencia), pd.Timestamp(fecha_hasta or fecha_referencia), freq='D')
+    dias = set()
+    for grupo in grupos:
+        if not grupo.get('filtro_fecha'):
+            return None
+        for fecha in fechas:
+            dias.update(fechas_grupo(grupo, fecha))
+    return sorted(dias)
+
+def leer_leads(cliente_id: str, fechas=None, directorio: str = None) -> pd.DataFrame:
+    """Lee los leads del almacén, solo de los días indicados si se pasan fechas."""
+    base = directorio_cliente(cliente_id, directorio)
+    if not os.path.isdir(base):
+        return pd.DataFrame()
+
+    if fechas is None:
+        # Los leads sin fecha se omiten antes de guardar; la partición es de versiones anteriores
+        particiones = sorted(p for p in os.listdir(base) if p.startswith('fecha=') and p != PARTICION_SIN_FECHA)
+    else:
+        particiones = [nombre_particion(pd.Timestamp(fecha)) for fecha in fechas]
+
+    dfs = [df for df in (_leer_particion(os.path.join(base, p)) for p in particiones) if df is not None]
+    if not dfs:
+        return pd.DataFrame()
+    # Las categorías de cada partición difieren: volver a compactar tras unirlas
+    return compactar_tipos(pd.concat(dfs, ignore_index=True).drop(columns='Clave_Lead'))
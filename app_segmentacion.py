@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import copy
 from datetime import datetime, timedelta
 import io
 import tempfile
@@ -8,7 +9,20 @@ import time
 from config_clientes import obtener_configuracion_cliente, obtener_lista_clientes
 from procesamiento import (
     limpiar_nombre, limpiar_telefono, procesar_cliente_especifico,
-    cargar_archivo, generar_archivo_descarga
+    generar_archivo_descarga, formato_grupo, nombre_archivo_salida,
+    generar_zip_grupos, generar_zip_rango, memoria_mb, programas_sin_codigo, separar_fechas_invalidas,
+    FORMATOS_SALIDA
+)
+from cache_archivos import cargar_archivos, hash_contenido
+from cache_sesion import CacheLRU, clave_carga, claves_grupos, hash_objeto
+from descargas import ArchivoDiferido, crear_ejecutor
+from deduplicacion import eliminar_duplicados as quitar_duplicados, CLAVES_DUPLICADOS, POLITICAS_CONSERVAR
+from supresion import filtrar_contactados, registrar_exportados
+from instrumentacion import MedicionPipeline
+from almacen_leads import DIRECTORIO_ALMACEN, guardar_leads, leer_leads, dias_necesarios, version_almacen
+from segmentacion import (
+    ASIGNACIONES, columna_resolucion, preparar_indices, compilar_reglas, asignar_grupos, mascaras_reglas,
+    seleccionar_grupo, segmentar_rango
 )
 
 # ====================
@@ -40,6 +54,23 @@ st.markdown("""
     **👈 Configura todo en la barra lateral**
 """)
 
+# Streamlit 1.52+ acepta una función como contenido de st.download_button y la
+# ejecuta recién cuando se pide la descarga
+DESCARGA_DIFERIDA = tuple(int(parte) for parte in st.__version__.split('.')[:2]) >= (1, 52)
+
+@st.cache_resource
+def ejecutor_descargas():
+    """Ejecutor compartido que prepara los archivos de descarga en segundo plano."""
+    return crear_ejecutor()
+
+def boton_descarga_diferida(archivo: ArchivoDiferido, key: str, **kwargs):
+    """Botón de descarga de un archivo que se genera al pedirlo y queda memorizado."""
+    if DESCARGA_DIFERIDA:
+        st.download_button(data=archivo.obtener, on_click='ignore', key=key, **kwargs)
+    elif archivo.listo() or st.button(f"⏳ Preparar: {kwargs['label']}", key=f"preparar_{key}",
+                                      use_container_width=kwargs.get('use_container_width', False)):
+        st.download_button(data=archivo.obtener(), key=key, **kwargs)
+
 # ====================
 # INTERFAZ DE USUARIO
 # ====================
@@ -62,24 +93,65 @@ with st.sidebar:
         datetime.now()
     )
     
+    # Backfill: segmentar un rango de fechas de referencia con una sola carga
+    modo_backfill = st.checkbox("🗓️ Backfill por rango de fechas", value=False)
+    if modo_backfill:
+        fecha_hasta = st.date_input(
+            "📅 Fecha final del rango",
+            fecha_referencia,
+            min_value=fecha_referencia
+        )
+    
     # 3. Opciones generales
     with st.expander("🔧 **Opciones Generales**", expanded=True):
         eliminar_duplicados = st.checkbox(
-            "Eliminar duplicados (por teléfono)",
+            "Eliminar duplicados",
             value=False
         )
         
+        if eliminar_duplicados:
+            clave_duplicados = st.selectbox(
+                "Identificar duplicados por",
+                options=list(CLAVES_DUPLICADOS),
+                format_func={'telefono': 'Teléfono', 'email': 'Email', 'telefono_email': 'Teléfono y email'}.get
+            )
+            conservar_duplicados = st.selectbox(
+                "Registro a conservar",
+                options=list(POLITICAS_CONSERVAR),
+                format_func={'mas_reciente': 'Más reciente (Fecha_Lead)', 'primero': 'Primero subido', 'ultimo': 'Último subido'}.get
+            )
+        
         mostrar_vista_previa = st.checkbox(
             "Mostrar vista previa",
             value=True
         )
+        
+        descargar_zip = st.checkbox(
+            "Descargar todos los grupos en un ZIP",
+            value=False
+        )
+        
+        usar_almacen = st.checkbox(
+            "Guardar en el almacén y segmentar con su historial",
+            value=False,
+            help=f"Los leads subidos se agregan a {DIRECTORIO_ALMACEN} y la segmentación lee de ahí "
+                 "los días que necesitan los grupos: alcanza con subir los exports nuevos."
+        )
+        
+        asignacion = st.selectbox(
+            "Asignación de leads a grupos",
+            options=list(ASIGNACIONES),
+            index=ASIGNACIONES.index(config_cliente.get('asignacion', 'superpuesta')),
+            format_func={'superpuesta': 'Un lead puede estar en varios grupos', 'exclusiva': 'Cada lead en un solo grupo (por prioridad)'}.get
+        )
     
     # 4. Editor de grupos
     st.header("✏️ **Editor de Grupos**")
     
     # Inicializar grupos con la configuración del cliente
     if 'grupos' not in st.session_state or st.session_state.cliente_actual != cliente_seleccionado:
-        st.session_state.grupos = config_cliente['grupos']
+        # Copia: las ediciones no deben modificar la configuración del cliente
+        st.session_state.grupos = copy.deepcopy(config_cliente['grupos'])
         st.session_state.cliente_actual = cliente_seleccionado
     
     # Botón para añadir grupo
@@ -93,25 +165,26 @@ with st.sidebar:
         })
     
     # Editor de grupos
+    # Las claves de los widgets incluyen al cliente: al cambiarlo no se arrastran los valores del anterior
     for i, grupo in enumerate(st.session_state.grupos[:]):
         with st.expander(f"**{grupo['nombre']}**", expanded=True):
             grupo['nombre'] = st.text_input(
                 "Nombre del grupo",
                 value=grupo['nombre'],
-                key=f"nombre_{i}"
+                key=f"nombre_{cliente_seleccionado}_{i}"
             )
             
             grupo['filtro_fecha'] = st.checkbox(
                 "Filtrar por fecha",
                 value=grupo.get('filtro_fecha', True),
-                key=f"filtro_fecha_{i}"
+                key=f"filtro_fecha_{cliente_seleccionado}_{i}"
             )
             
             # Agregar opción para filtrar por resolución
             grupo['filtro_resolucion'] = st.checkbox(
                 "Filtrar por resolución",
                 value=grupo.get('filtro_resolucion', True),
-                key=f"filtro_resolucion_{i}"
+                key=f"filtro_resolucion_{cliente_seleccionado}_{i}"
             )
             
             if grupo['filtro_fecha']:
@@ -119,41 +192,56 @@ with st.sidebar:
                 if 'dias_antes' not in grupo:
                     grupo['dias_antes'] = 1
                 
-                if st.checkbox("Usar múltiples días", value=isinstance(grupo['dias_antes'], list), key=f"multidias_{i}"):
+                if st.checkbox("Usar múltiples días", value=isinstance(grupo['dias_antes'], list), key=f"multidias_{cliente_seleccionado}_{i}"):
                     grupo['dias_antes'] = st.multiselect(
                         "Días a incluir",
                         options=list(range(8)),
                         default=grupo['dias_antes'] if isinstance(grupo['dias_antes'], list) else [1],
-                        key=f"dias_ms_{i}"
+                        key=f"dias_ms_{cliente_seleccionado}_{i}"
                     )
                 else:
                     grupo['dias_antes'] = st.number_input(
                         "Días antes",
                         min_value=0,
                         value=grupo['dias_antes'] if isinstance(grupo['dias_antes'], int) else 1,
-                        key=f"dias_num_{i}"
+                        key=f"dias_num_{cliente_seleccionado}_{i}"
                     )
             else:
                 grupo['dias_antes'] = None
             
+            grupo['dias_enfriamiento'] = st.number_input(
+                "Días sin volver a exportar un contacto (0 = desactivado)",
+                min_value=0,
+                value=int(grupo.get('dias_enfriamiento') or 0),
+                key=f"enfriamiento_{cliente_seleccionado}_{i}"
+            )
+            
             # Editor de resoluciones
             st.subheader("Resoluciones")
             if grupo['resoluciones'] is not None:  # Solo mostrar editor si hay resoluciones
                 if isinstance(grupo['resoluciones'], dict):
-                    # Para UNAB Nurturing
+                    # Para UNAB Nurturing: se edita solo el día de la fecha base y el resto
+                    # de los días se conserva (el backfill usa el día de cada fecha)
                     dia_actual = fecha_referencia.strftime('%A')
                     resoluciones_dia = grupo['resoluciones'].get(dia_actual, [])
-                    grupo['resoluciones'] = resoluciones_dia
+                    resoluciones_texto = st.text_area(
+                        f"Resoluciones del {dia_actual}",
+                        value="\n".join(resoluciones_dia),
+                        key=f"resoluciones_{cliente_seleccionado}_{i}_{dia_actual}"
+                    )
+                    editadas = [r.strip() for r in resoluciones_texto.split('\n') if r.strip()]
+                    if editadas != resoluciones_dia:
+                        grupo['resoluciones'] = {**grupo['resoluciones'], dia_actual: editadas}
                 else:
                     # Para otros grupos
                     resoluciones_texto = st.text_area(
                         "Resoluciones",
                         value="\n".join(grupo['resoluciones']),
-                        key=f"resoluciones_{i}"
+                        key=f"resoluciones_{cliente_seleccionado}_{i}"
                     )
                     grupo['resoluciones'] = [r.strip() for r in resoluciones_texto.split('\n') if r.strip()]
             
-            if st.button(f"❌ Eliminar grupo", key=f"del_{i}"):
+            if st.button(f"❌ Eliminar grupo", key=f"del_{cliente_seleccionado}_{i}"):
                 st.session_state.grupos.pop(i)
                 st.rerun()
 
@@ -166,192 +254,365 @@ uploaded_files = st.file_uploader(
     accept_multiple_files=True
 )
 
+# Streamlit vuelve a ejecutar el script en cada interacción: los datos cargados y
+# los resultados de cada grupo se cachean en la sesión para no reprocesar al
+# descargar un archivo o cambiar una opción de visualización
+if 'cache_resultados' not in st.session_state:
+    st.session_state.cache_resultados = CacheLRU()
+cache_resultados = st.session_state.cache_resultados
+
 if uploaded_files and st.button("🚀 **Ejecutar Segmentación**", type="primary", use_container_width=True):
     with st.spinner("Procesando datos..."):
         progress_bar = st.progress(0)
         status_text = st.empty()
-        registros_invalidos = None
-        
+
         try:
-            # 1. Carga de archivos
-            status_text.info("📂 Cargando archivos...")
-            dfs = []
-            for uploaded_file in uploaded_files:
-                df = cargar_archivo(uploaded_file, cliente_seleccionado)
-                dfs.append(df)
-            df_unificado = pd.concat(dfs, ignore_index=True)
-            progress_bar.progress(20)
-            
-            if df_unificado.empty:
-                st.error("❌ No se encontraron datos válidos")
-                st.stop()
-            
-            # 2. Procesamiento específico del cliente
-            status_text.info("🔄 Procesando datos específicos del cliente...")
-            df_unificado = procesar_cliente_especifico(df_unificado, cliente_seleccionado)
-            progress_bar.progress(30)
-            
-            # 3. Procesamiento de fechas
-            if 'Fecha Insert Lead' in df_unificado.columns:
-                # Intentar diferentes formatos de fecha
-                try:
-                    df_unificado['Fecha_Lead'] = pd.to_datetime(
-                        df_unificado['Fecha Insert Lead'], 
-                        format='%d-%m-%Y %H:%M:%S',
-                        errors='coerce'
-                    )
-                except:
-                    try:
-                        df_unificado['Fecha_Lead'] = pd.to_datetime(
-                            df_unificado['Fecha Insert Lead'], 
-                            format='%Y-%m-%d %H:%M:%S',
-                            errors='coerce'
-                        )
-                    except:
-                        df_unificado['Fecha_Lead'] = pd.to_datetime(
-                            df_unificado['Fecha Insert Lead'], 
-                            errors='coerce'
-                        )
-                
-                # Identificar registros con fechas inválidas
-                registros_invalidos = df_unificado[df_unificado['Fecha_Lead'].isna()].copy()
-                n_invalidos = len(registros_invalidos)
-                
-                if n_invalidos > 0:
-                    st.warning(f"⚠️ Se omitieron {n_invalidos} registros con fechas no reconocidas")
-                    df_unificado = df_unificado.dropna(subset=['Fecha_Lead'])
-            
-            progress_bar.progress(40)
-            
-            # 4. Procesamiento por grupos
-            resultados = []
             grupos_activos = st.session_state.grupos  # Ya no filtramos por activo
-            
-            for i, grupo in enumerate(grupos_activos):
-                status_text.info(f"🔍 Procesando grupo: {grupo['nombre']} ({i+1}/{len(grupos_activos)})")
-                
-                # Aplicar filtros según configuración
-                df_filtrado = df_unificado.copy()
-                
-                if grupo['filtro_fecha']:
-                    if isinstance(grupo['dias_antes'], list):
-                        # Para múltiples días
-                        fechas_validas = []
-                        for dias in grupo['dias_antes']:
-                            fecha_limite = fecha_referencia - pd.Timedelta(days=dias)
-                            fechas_validas.append(fecha_limite)
-                        df_filtrado = df_filtrado[df_filtrado['Fecha_Lead'].dt.date.isin(fechas_validas)]
-                    else:
-                        # Para un solo día
-                        fecha_limite = fecha_referencia - pd.Timedelta(days=grupo['dias_antes'])
-                        df_filtrado = df_filtrado[df_filtrado['Fecha_Lead'].dt.date == fecha_limite]
-                
-                # Filtrar por resolución si está activo
-                if grupo['filtro_resolucion'] and grupo['resoluciones'] is not None:
-                    col_resolucion = 'Ultima Resolución' if cliente_seleccionado in ['ULINEA', 'ANAHUAC'] else 'Resolución'
-                    if col_resolucion in df_filtrado.columns:
-                        if isinstance(grupo['resoluciones'], dict):
-                            # Para UNAB Nurturing
-                            dia_actual = fecha_referencia.strftime('%A')
-                            resoluciones_dia = grupo['resoluciones'].get(dia_actual, [])
-                            df_filtrado = df_filtrado[df_filtrado[col_resolucion].isin(resoluciones_dia)]
-                        else:
-                            # Para otros grupos
-                            df_filtrado = df_filtrado[df_filtrado[col_resolucion].isin(grupo['resoluciones'])]
-                
-                # Si no hay registros después del filtrado, mostrar mensaje
-                if len(df_filtrado) == 0:
-                    st.warning(f"📭 No se generaron resultados para {grupo['nombre']}. Ajusta tus criterios de filtrado.")
-                    continue
-                
-                # Generar archivo de descarga
-                archivo_bytes = generar_archivo_descarga(
-                    df_filtrado,
-                    grupo['columnas_salida'],
-                    cliente_seleccionado
-                )
-                
-                # Mostrar vista previa y botón de descarga en un expander
-                with st.expander(f"📊 {grupo['nombre']} ({len(df_filtrado)} registros)", expanded=True):
-                    # Vista previa de los datos
-                    columnas_disponibles = [col for col in grupo['columnas_salida'].values() if col in df_filtrado.columns]
-                    if columnas_disponibles:
-                        st.dataframe(
-                            df_filtrado[columnas_disponibles].head(),
-                            use_container_width=True
+
+            # Clave de los datos: contenido de los archivos subidos y opciones de carga
+            opciones_carga = {'duplicados': [clave_duplicados, conservar_duplicados] if eliminar_duplicados else None}
+            hashes_archivos = [hash_contenido(uploaded_file) for uploaded_file in uploaded_files]
+            clave_datos = clave_carga(hashes_archivos, cliente_seleccionado, opciones_carga)
+            datos = cache_resultados.obtener(clave_datos)
+            # Con el almacén, el resultado depende también de lo que ya tenía guardado
+            clave_segmentacion = hash_objeto({
+                'datos': clave_datos, 'almacen': version_almacen(cliente_seleccionado)
+            }) if usar_almacen else clave_datos
+
+            if modo_backfill:
+                clave_backfill = hash_objeto({
+                    'datos': clave_segmentacion, 'grupos': grupos_activos, 'asignacion': asignacion,
+                    'desde': str(fecha_referencia), 'hasta': str(fecha_hasta)
+                })
+                resultado_backfill = cache_resultados.obtener(clave_backfill)
+                claves, resultados = [], []
+            else:
+                claves = claves_grupos(clave_segmentacion, grupos_activos, fecha_referencia, asignacion)
+                resultados = [cache_resultados.obtener(clave) for clave in claves]
+            pendientes = [i for i, resultado in enumerate(resultados) if resultado is None]
+            # El almacén se actualiza y se lee solo si hay algo que segmentar
+            actualizar_almacen = usar_almacen and (pendientes or (modo_backfill and resultado_backfill is None))
+
+            # Medición real de cada etapa (solo las que hay que recalcular): alimenta la barra de progreso y las métricas
+            etapas_previstas = []
+            if datos is None:
+                etapas_previstas += ['carga', 'procesamiento', 'fechas_invalidas']
+                etapas_previstas += ['duplicados'] if eliminar_duplicados else []
+            etapas_previstas += ['almacen'] if actualizar_almacen else []
+            if modo_backfill:
+                etapas_previstas += ['backfill', 'zip'] if resultado_backfill is None else []
+            else:
+                etapas_previstas += ['indices'] if pendientes else []
+                etapas_previstas += [f"grupo:{grupos_activos[i]['nombre']}" for i in pendientes]
+            medicion = MedicionPipeline(
+                cliente_seleccionado,
+                etapas_previstas,
+                al_avanzar=lambda fraccion, etapa: progress_bar.progress(int(100 * fraccion))
+            )
+
+            if datos is None:
+                # 1. Carga de archivos: el parseo se reparte entre procesos, en el orden de subida
+                status_text.info(f"📂 Cargando {len(uploaded_files)} archivos...")
+                with medicion.etapa('carga', len(uploaded_files)) as registro:
+                    dfs, errores_carga = cargar_archivos(uploaded_files, cliente_seleccionado, hashes=hashes_archivos)
+                    df_unificado = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+                    registro['filas_salida'] = len(df_unificado)
+                    registro['memoria_df_mb'] = round(memoria_mb(df_unificado), 1)
+
+                # Un archivo con error no detiene a los demás (se informan junto a los resultados)
+                if df_unificado.empty:
+                    for error in errores_carga:
+                        st.error(f"❌ No se pudo cargar {error['archivo']}: {error['error']}")
+                    st.error("❌ No se encontraron datos válidos")
+                    st.stop()
+
+                # 2. Procesamiento específico del cliente
+                status_text.info("🔄 Procesando datos específicos del cliente...")
+                with medicion.etapa('procesamiento', len(df_unificado)) as registro:
+                    df_unificado = procesar_cliente_especifico(df_unificado, cliente_seleccionado)
+                    registro['filas_salida'] = len(df_unificado)
+                    registro['memoria_df_mb'] = round(memoria_mb(df_unificado), 1)
+
+                # 3. Registros con fechas no reconocidas (las fechas ya se parsearon al procesar)
+                with medicion.etapa('fechas_invalidas', len(df_unificado)) as registro:
+                    df_unificado, registros_invalidos = separar_fechas_invalidas(df_unificado)
+                    registro['filas_salida'] = len(df_unificado)
+                # Programas sin código entre los leads que se segmentan
+                reporte_programas = programas_sin_codigo(df_unificado, cliente_seleccionado)
+
+                # Eliminar duplicados entre todos los archivos subidos
+                reporte_duplicados = None
+                if eliminar_duplicados:
+                    status_text.info("🧹 Eliminando duplicados...")
+                    with medicion.etapa('duplicados', len(df_unificado)) as registro:
+                        df_unificado, reporte_duplicados = quitar_duplicados(
+                            df_unificado, clave_duplicados, conservar_duplicados
                         )
-                    else:
-                        st.warning("⚠️ No se encontraron las columnas esperadas en los datos")
-                    
-                    # Botón de descarga
-                    st.download_button(
-                        label=f"📥 Descargar {grupo['nombre']}",
-                        data=archivo_bytes,
-                        file_name=f"{cliente_seleccionado}_{grupo['nombre']}_{fecha_referencia.strftime('%d-%m-%Y')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        key=f"download_{i}"
-                    )
-                
-                progress_bar.progress(40 + int(50 * (i+1)/len(grupos_activos)))
-            
-            # Resultados finales
+                        registro['filas_salida'] = len(df_unificado)
+
+                datos = cache_resultados.guardar(clave_datos, {
+                    'df': df_unificado,
+                    'errores': errores_carga,
+                    'invalidos': registros_invalidos,
+                    'duplicados': reporte_duplicados,
+                    'programas_sin_codigo': reporte_programas,
+                })
+            else:
+                status_text.info("♻️ Reutilizando los datos ya procesados de estos archivos...")
+            df_unificado = datos['df']
+
+            # Almacén incremental: guardar lo subido y segmentar con los días que necesitan los grupos
+            resumen_almacen = None
+            if actualizar_almacen:
+                status_text.info("🗄️ Actualizando el almacén de leads...")
+                with medicion.etapa('almacen', len(df_unificado)) as registro:
+                    resumen_almacen = guardar_leads(df_unificado, cliente_seleccionado)
+                    df_unificado = leer_leads(cliente_seleccionado, dias_necesarios(
+                        grupos_activos, fecha_referencia, fecha_hasta if modo_backfill else None
+                    ))
+                    registro['filas_salida'] = len(df_unificado)
+
+            # 4. Backfill: todas las fechas del rango con la misma carga, un ZIP con una carpeta por fecha
+            if modo_backfill and resultado_backfill is None:
+                segmentos_rango = []
+                conteos_rango = []
+                with medicion.etapa('backfill', len(df_unificado)) as registro:
+                    for fecha, segmentos in segmentar_rango(
+                        df_unificado, grupos_activos, fecha_referencia, fecha_hasta,
+                        columna_resolucion(cliente_seleccionado), asignacion, cliente_seleccionado
+                    ):
+                        status_text.info(f"🗓️ Segmentando {fecha.strftime('%d-%m-%Y')}...")
+                        segmentos_fecha = []
+                        for grupo, df_grupo in segmentos:
+                            # Misma supresión que una ejecución diaria, en orden de fecha
+                            df_grupo, _ = filtrar_contactados(df_grupo, cliente_seleccionado, grupo, fecha)
+                            registrar_exportados(df_grupo, cliente_seleccionado, grupo, fecha)
+                            conteos_rango.append({'Fecha': fecha.date(), 'Grupo': grupo['nombre'], 'Registros': len(df_grupo)})
+                            if not df_grupo.empty:
+                                segmentos_fecha.append((grupo, df_grupo))
+                        segmentos_rango.append((fecha, segmentos_fecha))
+                    registro['filas_salida'] = sum(conteo['Registros'] for conteo in conteos_rango)
+
+                with medicion.etapa('zip', registro['filas_salida']):
+                    zip_bytes = generar_zip_rango(segmentos_rango, cliente_seleccionado) if registro['filas_salida'] else None
+                resultado_backfill = cache_resultados.guardar(clave_backfill, {
+                    'conteos': pd.DataFrame(conteos_rango, columns=['Fecha', 'Grupo', 'Registros']),
+                    'zip': zip_bytes,
+                    'fechas': len(segmentos_rango),
+                })
+
+            # 4. Procesamiento por grupos: solo los que no están en caché o cambiaron de configuración
+            if not modo_backfill and pendientes:
+                # Índices de fecha y resolución y reglas de todos los grupos evaluadas en una sola pasada
+                with medicion.etapa('indices', len(df_unificado)):
+                    indices = preparar_indices(df_unificado, columna_resolucion(cliente_seleccionado), cliente_seleccionado)
+                    reglas = compilar_reglas(grupos_activos, fecha_referencia, asignacion)
+                    mascaras = mascaras_reglas(asignar_grupos(indices, reglas), reglas)
+
+                for n, i in enumerate(pendientes):
+                    grupo = grupos_activos[i]
+                    status_text.info(f"🔍 Procesando grupo: {grupo['nombre']} ({n+1}/{len(pendientes)})")
+
+                    with medicion.etapa(f"grupo:{grupo['nombre']}", len(df_unificado)) as registro:
+                        # Materializar solo las filas del grupo que se exporta
+                        df_filtrado = seleccionar_grupo(df_unificado, mascaras[i])
+
+                        # Quitar los contactos que este grupo ya exportó en días recientes
+                        df_filtrado, n_suprimidos = filtrar_contactados(
+                            df_filtrado, cliente_seleccionado, grupo, fecha_referencia
+                        )
+                        registrar_exportados(df_filtrado, cliente_seleccionado, grupo, fecha_referencia)
+                        registro['filas_salida'] = len(df_filtrado)
+
+                        # Copia de la configuración con la que se calculó el resultado
+                        grupo = copy.deepcopy(grupo)
+                        resultados[i] = cache_resultados.guardar(claves[i], {
+                            'grupo': grupo,
+                            'data': df_filtrado,
+                            'registros': len(df_filtrado),
+                            'suprimidos': n_suprimidos,
+                            'filename': nombre_archivo_salida(cliente_seleccionado, grupo, fecha_referencia),
+                            # El archivo se genera recién al descargarlo (o en segundo plano) y se memoriza
+                            'archivo': ArchivoDiferido(
+                                generar_archivo_descarga, df_filtrado, grupo['columnas_salida'],
+                                cliente_seleccionado, formato_grupo(grupo)
+                            ),
+                        })
+
+            # 5. Archivos de descarga: se preparan en segundo plano mientras se muestran los resultados
+            zip_archivo = None
+            if not modo_backfill:
+                con_datos = [resultado for resultado in resultados if resultado['registros'] > 0]
+                if descargar_zip and con_datos:
+                    clave_zip = hash_objeto({'zip': claves})
+                    zip_archivo = cache_resultados.obtener(clave_zip) or cache_resultados.guardar(clave_zip, ArchivoDiferido(
+                        generar_zip_grupos,
+                        [(resultado['grupo'], resultado['data']) for resultado in con_datos],
+                        cliente_seleccionado,
+                        fecha_referencia
+                    ))
+                    zip_archivo.precalcular(ejecutor_descargas())
+                elif not descargar_zip:
+                    for resultado in con_datos:
+                        resultado['archivo'].precalcular(ejecutor_descargas())
+
+            medicion.guardar_historial()
             progress_bar.progress(100)
             time.sleep(0.5)
             progress_bar.empty()
             status_text.empty()
-            
-            if registros_invalidos is not None and len(registros_invalidos) > 0:
-                st.warning(f"⚠️ Se omitieron {len(registros_invalidos)} registros con fechas no reconocidas")
-                
-                # Botón para descargar registros omitidos
-                output_invalidos = io.BytesIO()
-                with pd.ExcelWriter(output_invalidos, engine='openpyxl') as writer:
-                    registros_invalidos.to_excel(writer, index=False)
-                
-                st.download_button(
-                    label="⬇️ Descargar registros omitidos",
-                    data=output_invalidos.getvalue(),
-                    file_name=f"{cliente_seleccionado}_Registros_omitidos_{fecha_referencia.strftime('%d-%m-%Y')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+            # La última ejecución queda en la sesión y se muestra en cada recarga
+            st.session_state.ultima_ejecucion = {
+                'cliente': cliente_seleccionado,
+                'fecha': fecha_referencia,
+                'fecha_hasta': fecha_hasta if modo_backfill else None,
+                'archivos': len(uploaded_files),
+                'datos': datos,
+                'resultados': resultados,
+                'backfill': resultado_backfill if modo_backfill else None,
+                'zip': zip_archivo,
+                'metricas': medicion.registros,
+                'metricas_json': medicion.a_json(),
+                'recalculados': len(pendientes),
+                'almacen': resumen_almacen,
+                'leads': len(df_unificado),
+            }
+
+        except Exception as e:
+            progress_bar.empty()
+            status_text.error(f"❌ Error: {str(e)}")
+            st.exception(e)
+
+# ====================
+# RESULTADOS
+# ====================
+ejecucion = st.session_state.get('ultima_ejecucion')
+if ejecucion and ejecucion['cliente'] == cliente_seleccionado:
+    datos = ejecucion['datos']
+    fecha_ejecucion = ejecucion['fecha']
+
+    for error in datos['errores']:
+        st.error(f"❌ No se pudo cargar {error['archivo']}: {error['error']}")
+
+    if ejecucion['almacen'] is not None:
+        st.info(f"🗄️ Almacén: {ejecucion['almacen']['nuevos']} leads nuevos y "
+                f"{ejecucion['almacen']['actualizados']} actualizados; se segmentaron {ejecucion['leads']} leads")
+
+    if ejecucion['resultados'] and ejecucion['recalculados'] < len(ejecucion['resultados']):
+        st.caption(f"♻️ {len(ejecucion['resultados']) - ejecucion['recalculados']} grupos sin cambios se tomaron de la caché")
+
+    if datos['duplicados'] is not None and not datos['duplicados'].empty:
+        st.info(f"🧹 Se eliminaron {int(datos['duplicados'].sum())} registros duplicados")
+        st.dataframe(datos['duplicados'].rename_axis('Archivo').reset_index(), hide_index=True)
+
+    if not datos['programas_sin_codigo'].empty:
+        st.warning(f"⚠️ {len(datos['programas_sin_codigo'])} programas no figuran en la tabla de códigos del cliente")
+        st.dataframe(datos['programas_sin_codigo'].reset_index(), hide_index=True)
+
+    with st.expander("⏱️ Métricas por etapa", expanded=False):
+        st.dataframe(pd.DataFrame(ejecucion['metricas']), hide_index=True, use_container_width=True)
+        st.download_button(
+            label="⬇️ Descargar métricas (JSON)",
+            data=ejecucion['metricas_json'],
+            file_name=f"{cliente_seleccionado}_metricas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            key="download_metricas"
+        )
+
+    registros_invalidos = datos['invalidos']
+    if registros_invalidos is not None and len(registros_invalidos) > 0:
+        st.warning(f"⚠️ Se omitieron {len(registros_invalidos)} registros con fechas no reconocidas")
+
+        # Botón para descargar registros omitidos (se genera una sola vez por carga)
+        if 'invalidos_xlsx' not in datos:
+            output_invalidos = io.BytesIO()
+            with pd.ExcelWriter(output_invalidos, engine='openpyxl') as writer:
+                registros_invalidos.to_excel(writer, index=False)
+            datos['invalidos_xlsx'] = output_invalidos.getvalue()
+
+        st.download_button(
+            label="⬇️ Descargar registros omitidos",
+            data=datos['invalidos_xlsx'],
+            file_name=f"{cliente_seleccionado}_Registros_omitidos_{fecha_ejecucion.strftime('%d-%m-%Y')}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+    backfill = ejecucion['backfill']
+    if backfill is not None:
+        if backfill['zip'] is None:
+            st.info("📭 No se generaron resultados en el rango. Ajusta tus criterios de filtrado.")
+        else:
+            st.dataframe(
+                backfill['conteos'].pivot_table(index='Fecha', columns='Grupo', values='Registros', aggfunc='sum'),
+                use_container_width=True
+            )
+            st.download_button(
+                label=f"📦 Descargar backfill ({backfill['fechas']} fechas)",
+                data=backfill['zip'],
+                file_name=f"{cliente_seleccionado}_{fecha_ejecucion.strftime('%d-%m-%Y')}_a_{ejecucion['fecha_hasta'].strftime('%d-%m-%Y')}.zip",
+                mime="application/zip",
+                type="primary",
+                use_container_width=True,
+                key="download_backfill"
+            )
+    else:
+        resultados = [resultado for resultado in ejecucion['resultados'] if resultado['registros'] > 0]
+        for resultado in ejecucion['resultados']:
+            if resultado['suprimidos'] > 0:
+                st.info(f"🔕 {resultado['grupo']['nombre']}: se omitieron {resultado['suprimidos']} contactos exportados en los últimos {resultado['grupo']['dias_enfriamiento']} días")
+            if resultado['registros'] == 0:
+                st.warning(f"📭 No se generaron resultados para {resultado['grupo']['nombre']}. Ajusta tus criterios de filtrado.")
+
+        if resultados:
+            st.success(f"✅ ¡Procesamiento completado! ({len(resultados)} grupos generados)")
+
+            # Métricas resumidas
+            cols = st.columns(3)
+            cols[0].metric("📂 Archivos", ejecucion['archivos'])
+            cols[1].metric("👥 Leads", ejecucion['leads'])
+            cols[2].metric("📊 Grupos", len(resultados))
+
+            # Descarga conjunta
+            if ejecucion['zip'] is not None:
+                boton_descarga_diferida(
+                    ejecucion['zip'],
+                    label=f"📦 Descargar todos los grupos ({len(resultados)})",
+                    file_name=f"{cliente_seleccionado}_{fecha_ejecucion.strftime('%d-%m-%Y')}.zip",
+                    mime="application/zip",
+                    type="primary",
+                    use_container_width=True,
+                    key="download_zip"
                 )
-            
-            if resultados:
-                st.success(f"✅ ¡Procesamiento completado! ({len(resultados)} grupos generados)")
-                
-                # Métricas resumidas
-                cols = st.columns(3)
-                cols[0].metric("📂 Archivos", len(uploaded_files))
-                cols[1].metric("👥 Leads", len(df_unificado))
-                cols[2].metric("📊 Grupos", len(resultados))
-                
-                # Descargas individuales
-                st.subheader("📥 **Descargar Reportes**", divider="rainbow")
-                for resultado in resultados:
-                    with st.expander(f"**{resultado['nombre']}** ({resultado['registros']} registros)", expanded=True):
-                        if mostrar_vista_previa:
+
+            # Descargas individuales
+            st.subheader("📥 **Descargar Reportes**", divider="rainbow")
+            for i, resultado in enumerate(resultados):
+                grupo = resultado['grupo']
+                with st.expander(f"**{grupo['nombre']}** ({resultado['registros']} registros)", expanded=True):
+                    if mostrar_vista_previa:
+                        columnas_disponibles = [col for col in grupo['columnas_salida'].values() if col in resultado['data'].columns]
+                        if columnas_disponibles:
                             st.dataframe(
-                                resultado['data'].head(3),
+                                resultado['data'][columnas_disponibles].head(3),
                                 use_container_width=True,
                                 hide_index=True
                             )
-                        
-                        # Usar st.download_button con on_click para evitar recarga
-                        st.download_button(
-                            label=f"⬇️ Descargar {resultado['nombre']}",
-                            data=resultado['archivo'],
+                        else:
+                            st.warning("⚠️ No se encontraron las columnas esperadas en los datos")
+
+                    if ejecucion['zip'] is None:
+                        boton_descarga_diferida(
+                            resultado['archivo'],
+                            label=f"⬇️ Descargar {grupo['nombre']}",
                             file_name=resultado['filename'],
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            mime=FORMATOS_SALIDA[formato_grupo(grupo)]['mime'],
                             use_container_width=True,
                             type="primary",
-                            key=f"dl_{resultado['filename']}"
+                            key=f"download_{i}"
                         )
-            else:
-                st.info("📭 No se generaron resultados. Ajusta tus criterios de filtrado.")
-        
-        except Exception as e:
-            progress_bar.empty()
-            status_text.error(f"❌ Error: {str(e)}")
-            st.exception(e)
+        else:
+            st.info("📭 No se generaron resultados. Ajusta tus criterios de filtrado.")
 
 # ====================
 # SECCIÓN DE AYUDA
@@ -367,5 +628,5 @@ with st.expander("📚 **Guía de Uso**", expanded=False):
 
     ### ⚠️ **Registros omitidos**
     - Si hay registros con fechas inválidas, podrás descargarlos
-    - Revisa el formato de fecha en tus archivos (debe ser DD-MM-AAAA HH:MM:SS)
+    - Revisa el formato de fecha en tus archivos (se reconocen DD-MM-AAAA HH:MM:SS, AAAA-MM-DD HH:MM:SS y sus variantes con /)
     """)
@@ -0,0 +1,241 @@
+"""Segmentación por lotes sin interfaz para todos los clientes configurados.
+
+Ejemplo:
+    python batch_segmentacion.py --base entradas/ --fecha 2024-03-04 --salida salidas/
+    python batch_segmentacion.py --entrada CREXE=/datos/crexe --entrada UNAB=/datos/unab
+    python batch_segmentacion.py --base entradas/ --fecha 2024-03-01 --hasta 2024-03-04
+    python batch_segmentacion.py --entrada ULINEA=/datos/ulinea_2023 --bloques 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from almacen_leads import guardar_leads, leer_leads, dias_necesarios
+from config_clientes import CLIENTES, obtener_configuracion_cliente
+from procesamiento import (
+    procesar_cliente_especifico, cargar_archivo, escribir_salida, formato_grupo, nombre_archivo_salida,
+    programas_sin_codigo, separar_fechas_invalidas
+)
+from supresion import filtrar_contactados, registrar_exportados
+from segmentacion_bloques import segmentar_en_bloques
+from instrumentacion import MedicionPipeline
+from segmentacion import (
+    columna_resolucion, preparar_indices, compilar_reglas, asignar_grupos, mascaras_reglas, seleccionar_grupo,
+    segmentar_rango
+)
+
+def extensiones_cliente(cliente_id: str) -> tuple:
+    """Obtiene las extensiones de archivo aceptadas para el cliente."""
+    return ('.xls', '.xlsx', '.csv') if cliente_id == 'PK_CBA' else ('.xls', '.xlsx')
+
+def listar_archivos(directorio: str, cliente_id: str) -> list:
+    """Lista los archivos de entrada del cliente en orden alfabético."""
+    if not os.path.isdir(directorio):
+        return []
+    return [
+        os.path.join(directorio, nombre)
+        for nombre in sorted(os.listdir(directorio))
+        if nombre.lower().endswith(extensiones_cliente(cliente_id))
+    ]
+
+def exportar_grupo(df_grupo: pd.DataFrame, cliente_id: str, grupo: dict, fecha_referencia,
+                   directorio_salida: str) -> int:
+    """Suprime los contactados, escribe el archivo del grupo y registra lo exportado."""
+    # Quitar los contactos que este grupo ya exportó en días recientes
+    df_filtrado, _ = filtrar_contactados(df_grupo, cliente_id, grupo, fecha_referencia)
+    if df_filtrado.empty:
+        return 0
+
+    # Escribir directo al archivo de salida, sin armar los bytes en memoria
+    os.makedirs(directorio_salida, exist_ok=True)
+    escribir_salida(
+        df_filtrado,
+        grupo['columnas_salida'],
+        os.path.join(directorio_salida, nombre_archivo_salida(cliente_id, grupo, fecha_referencia)),
+        formato_grupo(grupo)
+    )
+    registrar_exportados(df_filtrado, cliente_id, grupo, fecha_referencia)
+    return len(df_filtrado)
+
+def segmentar_cliente(cliente_id: str, directorio: str, fecha_referencia, directorio_salida: str,
+                      directorio_almacen: str = None, fecha_hasta=None, archivos: list = None,
+                      tamano_bloque: int = None) -> dict:
+    """Carga, procesa y exporta todos los grupos de un cliente.
+
+    Con directorio_almacen, los leads nuevos se incorporan al almacén
+    incremental y la segmentación lee solo los días que necesitan los grupos.
+    Con fecha_hasta se segmenta cada fecha de referencia del rango con una
+    sola carga y la salida queda en una subcarpeta por fecha. Con archivos
+    se procesan esas rutas en lugar de listar el directorio. Con tamano_bloque
+    los archivos se procesan por bloques de esa cantidad de filas, sin
+    cargarlos enteros en memoria.
+    """
+    inicio = time.perf_counter()
+    resumen = {'cliente': cliente_id, 'archivos': 0, 'leads': 0, 'fechas_invalidas': 0, 'grupos': {}, 'error': None}
+    config = obtener_configuracion_cliente(cliente_id)
+    grupos = config['grupos']
+    medicion = MedicionPipeline(cliente_id, [])
+
+    try:
+        archivos = listar_archivos(directorio, cliente_id) if archivos is None else list(archivos)
+        resumen['archivos'] = len(archivos)
+        if not archivos and not directorio_almacen:
+            resumen['error'] = f"No se encontraron archivos en {directorio}"
+            return resumen
+
+        if tamano_bloque:
+            # Fuera de memoria: cada bloque se carga, segmenta y agrega a los archivos de salida
+            with medicion.etapa('bloques') as registro:
+                resultado = segmentar_en_bloques(
+                    archivos, cliente_id, grupos, fecha_referencia, directorio_salida,
+                    config.get('asignacion', 'superpuesta'), tamano_bloque
+                )
+                registro['filas_entrada'] = resumen['leads'] = resultado['leads']
+                registro['filas_salida'] = sum(resultado['grupos'].values())
+                registro['bloques'] = resultado['bloques']
+            resumen['grupos'] = resultado['grupos']
+            resumen['programas_sin_codigo'] = resultado['programas_sin_codigo']
+            resumen['fechas_invalidas'] = resultado['fechas_invalidas']
+            return resumen
+
+        # 1. Carga y procesamiento específico del cliente
+        if archivos:
+            with medicion.etapa('carga', len(archivos)) as registro:
+                df_unificado = pd.concat([cargar_archivo(ruta, cliente_id) for ruta in archivos], ignore_index=True)
+                registro['filas_salida'] = len(df_unificado)
+            with medicion.etapa('procesamiento', len(df_unificado)) as registro:
+                df_unificado = procesar_cliente_especifico(df_unificado, cliente_id)
+                registro['filas_salida'] = len(df_unificado)
+            # Igual que en la app: los registros con fecha no reconocida se omiten
+            with medicion.etapa('fechas_invalidas', len(df_unificado)) as registro:
+                df_unificado, invalidos = separar_fechas_invalidas(df_unificado)
+                resumen['fechas_invalidas'] = len(invalidos)
+                registro['filas_salida'] = len(df_unificado)
+            # Sobre los leads que se segmentan, como en el modo por bloques
+            resumen['programas_sin_codigo'] = {
+                programa: int(n) for programa, n in programas_sin_codigo(df_unificado, cliente_id).items()
+            }
+        else:
+            df_unificado = pd.DataFrame()
+
+        # 2. Almacén incremental: guardar lo nuevo y leer solo los días necesarios
+        if directorio_almacen:
+            with medicion.etapa('almacen', len(df_unificado)) as registro:
+                resumen['almacen'] = guardar_leads(df_unificado, cliente_id, directorio_almacen)
+                df_unificado = leer_leads(cliente_id, dias_necesarios(grupos, fecha_referencia, fecha_hasta), directorio_almacen)
+                registro['filas_salida'] = len(df_unificado)
+        resumen['leads'] = len(df_unificado)
+
+        # 3. Segmentación y exportación por grupo
+        os.makedirs(directorio_salida, exist_ok=True)
+        asignacion = config.get('asignacion', 'superpuesta')
+        if fecha_hasta is None:
+            # Todas las reglas del cliente se evalúan juntas en una sola pasada
+            with medicion.etapa('indices', len(df_unificado)):
+                indices = preparar_indices(df_unificado, columna_resolucion(cliente_id), cliente_id)
+                reglas = compilar_reglas(grupos, fecha_referencia, asignacion)
+                mascaras = mascaras_reglas(asignar_grupos(indices, reglas), reglas)
+            for grupo, mascara in zip(grupos, mascaras):
+                with medicion.etapa(f"grupo:{grupo['nombre']}", len(df_unificado)) as registro:
+                    resumen['grupos'][grupo['nombre']] = registro['filas_salida'] = exportar_grupo(
+                        seleccionar_grupo(df_unificado, mascara), cliente_id, grupo, fecha_referencia, directorio_salida
+                    )
+        else:
+            # Backfill: todas las fechas del rango a partir de la misma carga, una carpeta por fecha
+            resumen['fechas'] = {}
+            with medicion.etapa('backfill', len(df_unificado)) as registro:
+                registro['filas_salida'] = 0
+                for fecha, segmentos in segmentar_rango(df_unificado, grupos, fecha_referencia, fecha_hasta,
+                                                        columna_resolucion(cliente_id), asignacion, cliente_id):
+                    directorio_fecha = os.path.join(directorio_salida, f"{fecha:%Y-%m-%d}")
+                    conteos = resumen['fechas'][f"{fecha:%Y-%m-%d}"] = {}
+                    for grupo, df_grupo in segmentos:
+                        n = exportar_grupo(df_grupo, cliente_id, grupo, fecha, directorio_fecha)
+                        conteos[grupo['nombre']] = n
+                        resumen['grupos'][grupo['nombre']] = resumen['grupos'].get(grupo['nombre'], 0) + n
+                        registro['filas_salida'] += n
+    except Exception as e:
+        resumen['error'] = str(e)
+    finally:
+        resumen['segundos'] = time.perf_counter() - inicio
+        resumen['metricas'] = medicion.a_dict()
+
+    return resumen
+
+def parsear_entradas(entradas: list, base: str) -> dict:
+    """Resuelve el directorio de entrada de cada cliente."""
+    directorios = {cliente_id: os.path.join(base, cliente_id) for cliente_id in CLIENTES} if base else {}
+    for entrada in entradas:
+        cliente_id, sep, directorio = entrada.partition('=')
+        if not sep or cliente_id not in CLIENTES:
+            raise argparse.ArgumentTypeError(f"Entrada inválida: {entrada} (usar CLIENTE=DIRECTORIO)")
+        directorios[cliente_id] = directorio
+    return directorios
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Segmenta los leads de todos los clientes en paralelo.")
+    parser.add_argument('--base', help="Directorio con una subcarpeta por cliente (CREXE/, UNAB/, ...)")
+    parser.add_argument('--entrada', action='append', default=[], metavar='CLIENTE=DIR',
+                        help="Directorio de entrada de un cliente; se puede repetir")
+    parser.add_argument('--fecha', default=datetime.now().strftime('%Y-%m-%d'),
+                        help="Fecha de referencia AAAA-MM-DD (por defecto hoy)")
+    parser.add_argument('--hasta', help="Backfill: última fecha de referencia AAAA-MM-DD; --fecha es la primera")
+    parser.add_argument('--salida', default='salida', help="Directorio de salida de los reportes")
+    parser.add_argument('--almacen', help="Directorio del almacén incremental de leads (opcional)")
+    parser.add_argument('--bloques', type=int, metavar='FILAS',
+                        help="Procesa los archivos por bloques de FILAS filas sin cargarlos enteros en memoria")
+    parser.add_argument('--metricas', help="Archivo JSON donde guardar las métricas por etapa y grupo")
+    parser.add_argument('--workers', type=int, default=None, help="Cantidad de procesos")
+    args = parser.parse_args(argv)
+
+    try:
+        directorios = parsear_entradas(args.entrada, args.base)
+        fecha_referencia = datetime.strptime(args.fecha, '%Y-%m-%d').date()
+        fecha_hasta = datetime.strptime(args.hasta, '%Y-%m-%d').date() if args.hasta else None
+        if fecha_hasta is not None and fecha_hasta < fecha_referencia:
+            raise ValueError("--hasta no puede ser anterior a --fecha")
+        if args.bloques is not None and args.bloques <= 0:
+            raise ValueError("--bloques debe ser mayor que cero")
+        if args.bloques and (args.almacen or fecha_hasta):
+            raise ValueError("--bloques no se puede combinar con --almacen ni --hasta")
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+    if not directorios:
+        parser.error("Indicar --base o al menos una --entrada")
+
+    inicio = time.perf_counter()
+    resumenes = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futuros = [
+            executor.submit(segmentar_cliente, cliente_id, directorio, fecha_referencia,
+                            os.path.join(args.salida, cliente_id), args.almacen, fecha_hasta,
+                            tamano_bloque=args.bloques)
+            for cliente_id, directorio in directorios.items()
+        ]
+        for futuro in as_completed(futuros):
+            resumen = futuro.result()
+            resumenes.append(resumen)
+            estado = f"ERROR: {resumen['error']}" if resumen['error'] else \
+                ', '.join(f"{nombre}={n}" for nombre, n in resumen['grupos'].items())
+            print(f"{resumen['cliente']:<8} {resumen['segundos']:8.2f}s  "
+                  f"{resumen['archivos']} archivos, {resumen['leads']} leads  {estado}")
+            if resumen['fechas_invalidas']:
+                print(f"{'':<8} {resumen['fechas_invalidas']} registros omitidos por fecha no reconocida")
+            if resumen.get('programas_sin_codigo'):
+                print(f"{'':<8} programas sin código: " +
+                      ', '.join(f"{programa} ({n})" for programa, n in resumen['programas_sin_codigo'].items()))
+
+    print(f"{'TOTAL':<8} {time.perf_counter() - inicio:8.2f}s")
+    if args.metricas:
+        with open(args.metricas, 'w', encoding='utf-8') as f:
+            json.dump([resumen['metricas'] for resumen in resumenes], f, ensure_ascii=False, indent=2, default=str)
+    return 1 if any(resumen['error'] for resumen in resumenes) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""Generador de leads sintéticos y benchmark por etapa del pipeline.
+
+Ejemplo:
+    python benchmark_segmentacion.py --filas 10000 100000 --salida bench.json
+    python benchmark_segmentacion.py --clientes CREXE PK_CBA --filas 10000000
+"""
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from config_clientes import CLIENTES, obtener_esquema_cliente
+from fechas import parsear_fechas
+from procesamiento import (
+    LIMPIEZA_VECTORIZADA, cargar_archivo, compactar_tipos, formato_grupo,
+    generar_archivo_descarga
+)
+from segmentacion import (
+    columna_resolucion, preparar_indices, compilar_reglas, asignar_grupos, mascaras_reglas, seleccionar_grupo
+)
+
+# Tamaños cubiertos por defecto (10k a 10M filas)
+FILAS_POR_DEFECTO = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# Límite de filas de una hoja de Excel (incluye el encabezado)
+MAX_FILAS_EXCEL = 1_048_575
+
+NOMBRES = ['juan', 'MARÍA', 'José Luis', 'ana', 'Sofía', 'PEDRO', 'lucía', 'Martín', 'camila', 'Ñandú']
+APELLIDOS = ['pérez', 'GÓMEZ', 'Rodríguez', 'fernández', 'López', 'díaz']
+DOMINIOS = ['gmail.com', 'Hotmail.com', 'yahoo.com.ar', 'outlook.com']
+PROGRAMAS = [
+    'Abogacía', 'Tecnicatura Universitaria en Martillero Público y Corredor',
+    'Licenciatura en Psicopedagogía', 'Administración de Empresas', 'Marketing Digital',
+]
+RESOLUCIONES_ULINEA = ['1 - Contactado', '2 - No contesta', '3 - Interesado', '4 - Inscripto', '5 - Descartado']
+
+def resoluciones_cliente(cliente_id: str) -> list:
+    """Obtiene valores realistas de resolución a partir de los grupos del cliente."""
+    valores = []
+    for grupo in CLIENTES[cliente_id]['grupos']:
+        resoluciones = grupo.get('resoluciones')
+        if isinstance(resoluciones, dict):
+            for lista in resoluciones.values():
+                valores.extend(lista)
+        elif resoluciones:
+            valores.extend(resoluciones)
+    if cliente_id in ['ULINEA', 'ANAHUAC']:
+        valores.extend(RESOLUCIONES_ULINEA)
+    return sorted(set(valores)) or ['Sin resolución']
+
+def _elegir(rng, valores: list, n: int) -> np.ndarray:
+    """Elige n valores al azar de la lista."""
+    return np.asarray(valores, dtype=object)[rng.integers(0, len(valores), n)]
+
+def _con_ruido(rng, valores: np.ndarray, proporcion: float) -> np.ndarray:
+    """Reemplaza una proporción de los valores por nulos."""
+    valores = valores.astype(object)
+    valores[rng.random(len(valores)) < proporcion] = None
+    return valores
+
+def generar_leads(cliente_id: str, n_filas: int, fecha_referencia=None, semilla: int = 0) -> pd.DataFrame:
+    """Genera un archivo sintético con el esquema de origen del cliente.
+
+    Incluye nombres con mayúsculas y espacios irregulares, teléfonos con
+    distintos formatos, emails sucios, fechas en el formato dominante con
+    una minoría en formatos alternativos o inválidos, y columnas extra.
+    """
+    rng = np.random.default_rng(semilla)
+    fecha_referencia = fecha_referencia or datetime.now().date()
+    mapeo = obtener_esquema_cliente(cliente_id)
+
+    nombres = pd.Series(_elegir(rng, NOMBRES, n_filas)) + ' ' + pd.Series(_elegir(rng, APELLIDOS, n_filas))
+    nombres = np.where(rng.random(n_filas) < 0.1, '  ' + nombres + ' ', nombres)
+
+    usuarios = pd.Series(rng.integers(0, max(n_filas // 2, 1), n_filas)).astype(str)
+    emails = ' user' + usuarios + '@' + pd.Series(_elegir(rng, DOMINIOS, n_filas))
+
+    numeros = pd.Series(rng.integers(10 ** 9, 10 ** 10, n_filas)).astype(str)
+    formatos_tel = rng.integers(0, 4, n_filas)
+    telefonos = np.select(
+        [formatos_tel == 0, formatos_tel == 1, formatos_tel == 2],
+        ['+54 9 ' + numeros.str[:2] + ' ' + numeros.str[2:6] + '-' + numeros.str[6:],
+         '(0' + numeros.str[:3] + ') ' + numeros.str[3:],
+         numeros],
+        default=numeros.str[:4] + '.' + numeros.str[4:]
+    )
+
+    # Fechas en los últimos 10 días: 90% formato dominante, 8% alternativo, 2% inválidas
+    base = pd.Timestamp(fecha_referencia) - pd.Timedelta(days=10)
+    instantes = base + pd.to_timedelta(rng.integers(0, 10 * 86400, n_filas), unit='s')
+    fechas = np.where(rng.random(n_filas) < 0.92, instantes.strftime('%d-%m-%Y %H:%M:%S'),
+                      instantes.strftime('%Y-%m-%d %H:%M:%S'))
+    fechas = np.where(rng.random(n_filas) < 0.02, 'sin fecha', fechas)
+
+    valores = {
+        'Nombre': _con_ruido(rng, np.asarray(nombres, dtype=object), 0.01),
+        'Email': _con_ruido(rng, emails.to_numpy(dtype=object), 0.03),
+        'Tel': _con_ruido(rng, telefonos, 0.02),
+        'Programa': _elegir(rng, PROGRAMAS, n_filas),
+        'Resolución': _elegir(rng, resoluciones_cliente(cliente_id), n_filas),
+        'Fecha Insert Lead': fechas,
+    }
+    df = pd.DataFrame({col_origen: valores[col_destino] for col_destino, col_origen in mapeo.items()})
+
+    # Columnas extra como en los exports del CRM
+    df['Apellido'] = _elegir(rng, APELLIDOS, n_filas)
+    df['Id Lead'] = np.arange(n_filas)
+    df['Origen'] = _elegir(rng, ['Facebook', 'Google', 'Orgánico', 'Referido'], n_filas)
+    return df
+
+def _medir(funcion, repeticiones: int):
+    """Ejecuta la función y devuelve el mejor tiempo y el último resultado."""
+    mejor, resultado = None, None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor, resultado
+
+def _archivo_entrada(df: pd.DataFrame, cliente_id: str) -> io.BytesIO:
+    """Serializa el DataFrame en el formato de entrada del cliente (CSV o Excel)."""
+    archivo = io.BytesIO()
+    if cliente_id == 'PK_CBA':
+        df.to_csv(archivo, index=False, encoding='latin1')
+    else:
+        df.to_excel(archivo, index=False)
+    archivo.seek(0)
+    return archivo
+
+def medir_cliente(cliente_id: str, n_filas: int, fecha_referencia, repeticiones: int = 1,
+                  max_filas_excel: int = 100_000) -> list:
+    """Mide por separado carga, limpieza, fechas, segmentación y exportación."""
+    resultados = []
+
+    def registrar(etapa, segundos, filas_entrada, filas_salida=None, nota=None):
+        resultados.append({
+            'cliente': cliente_id, 'filas': n_filas, 'etapa': etapa,
+            'segundos': None if segundos is None else round(segundos, 6),
+            'filas_entrada': filas_entrada, 'filas_salida': filas_salida, 'nota': nota,
+        })
+
+    df_origen = generar_leads(cliente_id, n_filas, fecha_referencia)
+    mapeo = obtener_esquema_cliente(cliente_id)
+
+    # 1. Carga (los Excel grandes se omiten: escribirlos tarda más que el propio benchmark)
+    if cliente_id != 'PK_CBA' and n_filas > max_filas_excel:
+        registrar('carga', None, n_filas, nota=f"omitida: Excel de más de {max_filas_excel} filas")
+    else:
+        archivo = _archivo_entrada(df_origen, cliente_id)
+
+        def cargar():
+            archivo.seek(0)
+            return cargar_archivo(archivo, cliente_id)
+        segundos, df_cargado = _medir(cargar, repeticiones)
+        registrar('carga', segundos, n_filas, len(df_cargado))
+        del archivo, df_cargado
+
+    # 2. Limpieza de columnas
+    def limpiar():
+        return pd.DataFrame({
+            col_destino: LIMPIEZA_VECTORIZADA[col_destino](df_origen[col_origen])
+            for col_destino, col_origen in mapeo.items() if col_destino in LIMPIEZA_VECTORIZADA
+        })
+    segundos, df_limpio = _medir(limpiar, repeticiones)
+    registrar('limpieza', segundos, n_filas, len(df_limpio))
+
+    # 3. Fechas (sin formato cacheado para medir también la inferencia)
+    segundos, fechas = _medir(lambda: parsear_fechas(df_origen[mapeo['Fecha Insert Lead']]), repeticiones)
+    registrar('fechas', segundos, n_filas, int(fechas.notna().sum()))
+
+    df_limpio['Fecha_Lead'] = fechas
+    df_limpio = compactar_tipos(df_limpio)
+
+    # 4. Segmentación de todos los grupos
+    grupos = CLIENTES[cliente_id]['grupos']
+
+    def segmentar():
+        indices = preparar_indices(df_limpio, columna_resolucion(cliente_id), cliente_id)
+        reglas = compilar_reglas(grupos, fecha_referencia, CLIENTES[cliente_id].get('asignacion', 'superpuesta'))
+        return mascaras_reglas(asignar_grupos(indices, reglas), reglas)
+    segundos, mascaras = _medir(segmentar, repeticiones)
+    registrar('segmentacion', segundos, n_filas, int(sum(mascara.sum() for mascara in mascaras)))
+
+    # 5. Exportación de cada grupo con su formato configurado
+    for grupo, mascara in zip(grupos, mascaras):
+        df_grupo = seleccionar_grupo(df_limpio, mascara)
+        etapa = f"exportacion:{grupo['nombre']}"
+        if formato_grupo(grupo) == 'xlsx' and len(df_grupo) > MAX_FILAS_EXCEL:
+            registrar(etapa, None, len(df_grupo), nota="omitida: supera el límite de filas de Excel")
+            continue
+        segundos, archivo_bytes = _medir(
+            lambda: generar_archivo_descarga(df_grupo, grupo['columnas_salida'], cliente_id, formato_grupo(grupo)),
+            repeticiones
+        )
+        registrar(etapa, segundos, len(df_grupo), len(df_grupo), nota=f"{len(archivo_bytes)} bytes")
+
+    return resultados
+
+def version_codigo() -> str:
+    """Obtiene el commit actual para poder comparar resultados entre versiones."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark por etapa con leads sintéticos.")
+    parser.add_argument('--clientes', nargs='+', default=list(CLIENTES), choices=list(CLIENTES))
+    parser.add_argument('--filas', nargs='+', type=int, default=FILAS_POR_DEFECTO)
+    parser.add_argument('--fecha', default=datetime.now().strftime('%Y-%m-%d'),
+                        help="Fecha de referencia AAAA-MM-DD (por defecto hoy)")
+    parser.add_argument('--repeticiones', type=int, default=1, help="Se informa el mejor tiempo")
+    parser.add_argument('--max-filas-excel', type=int, default=100_000,
+                        help="Máximo de filas para medir la carga de archivos Excel")
+    parser.add_argument('--salida', default='benchmark_resultados.json')
+    args = parser.parse_args(argv)
+
+    fecha_referencia = datetime.strptime(args.fecha, '%Y-%m-%d').date()
+    resultados = []
+    for n_filas in args.filas:
+        for cliente_id in args.clientes:
+            for fila in medir_cliente(cliente_id, n_filas, fecha_referencia, args.repeticiones, args.max_filas_excel):
+                resultados.append(fila)
+                segundos = '-' if fila['segundos'] is None else f"{fila['segundos']:.3f}s"
+                print(f"{cliente_id:<8} {n_filas:>10} {fila['etapa']:<32} {segundos:>10}")
+
+    informe = {
+        'fecha_ejecucion': datetime.now().isoformat(timespec='seconds'),
+        'version': version_codigo(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'fecha_referencia': fecha_referencia.isoformat(),
+        'resultados': resultados,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {args.salida}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
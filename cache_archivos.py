@@ -0,0 +1,196 @@
+import hashlib
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from config_clientes import obtener_esquema_cliente
+from fechas import parsear_fechas
+from procesamiento import cargar_archivo
+
+# Directorio y tamaño máximo (en bytes) de la caché de archivos parseados
+DIRECTORIO_CACHE = os.environ.get(
+    'SEGMENTACION_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'segmentacion_leads_cache')
+)
+TAMANO_MAXIMO_CACHE = int(os.environ.get('SEGMENTACION_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# Se incrementa si cambia la forma de cargar los archivos para invalidar la caché
+VERSION_CACHE = 2
+
+def hash_contenido(archivo, tamano_bloque: int = 1024 * 1024) -> str:
+    """Calcula el SHA-256 del contenido del archivo sin mover su posición."""
+    sha = hashlib.sha256()
+    if hasattr(archivo, 'read'):
+        posicion = archivo.tell()
+        archivo.seek(0)
+        for bloque in iter(lambda: archivo.read(tamano_bloque), b''):
+            sha.update(bloque)
+        archivo.seek(posicion)
+    else:
+        with open(archivo, 'rb') as f:
+            for bloque in iter(lambda: f.read(tamano_bloque), b''):
+                sha.update(bloque)
+    return sha.hexdigest()
+
+def ruta_cache(hash_archivo: str, cliente_id: str, directorio: str = None) -> str:
+    """Obtiene la ruta del Parquet cacheado para un archivo y cliente."""
+    directorio = directorio or DIRECTORIO_CACHE
+    return os.path.join(directorio, f"v{VERSION_CACHE}_{cliente_id}_{hash_archivo}.parquet")
+
+def desalojar_cache(directorio: str = None, tamano_maximo: int = None) -> int:
+    """Elimina las entradas menos usadas hasta respetar el tamaño máximo.
+
+    Devuelve la cantidad de entradas eliminadas.
+    """
+    directorio = directorio or DIRECTORIO_CACHE
+    tamano_maximo = TAMANO_MAXIMO_CACHE if tamano_maximo is None else tamano_maximo
+    if not os.path.isdir(directorio):
+        return 0
+
+    entradas = []
+    for nombre in os.listdir(directorio):
+        if nombre.endswith('.parquet'):
+            estado = os.stat(os.path.join(directorio, nombre))
+            entradas.append((estado.st_mtime, estado.st_size, nombre))
+
+    # La fecha de modificación se actualiza en cada acierto: la más antigua es la menos usada
+    entradas.sort()
+    total = sum(tamano for _, tamano, _ in entradas)
+    eliminadas = 0
+    for _, tamano, nombre in entradas:
+        if total <= tamano_maximo:
+            break
+        try:
+            os.remove(os.path.join(directorio, nombre))
+        except FileNotFoundError:
+            pass
+        total -= tamano
+        eliminadas += 1
+    return eliminadas
+
+def _leer_cache(ruta: str):
+    """Lee una entrada de la caché y la marca como usada (None si no está)."""
+    if os.path.exists(ruta):
+        try:
+            df = pd.read_parquet(ruta)
+            os.utime(ruta)
+            return df
+        except Exception:
+            # Entrada corrupta o eliminada en paralelo: se vuelve a parsear
+            pass
+    return None
+
+def _guardar_cache(df: pd.DataFrame, ruta: str, directorio: str, tamano_maximo: int = None):
+    """Guarda un DataFrame parseado en la caché de forma atómica."""
+    # La caché es opcional: si no se puede escribir (disco lleno, permisos)
+    # se devuelve igual el DataFrame parseado
+    ruta_temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        df.to_parquet(ruta_temporal, index=False)
+        os.replace(ruta_temporal, ruta)
+        desalojar_cache(directorio, tamano_maximo)
+    except Exception:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+
+# ====================
+# CARGA PARALELA DE VARIOS ARCHIVOS
+# ====================
+
+def nombre_archivo(archivo) -> str:
+    """Obtiene el nombre con el que se identifica un archivo subido o una ruta."""
+    return getattr(archivo, 'name', None) or os.path.basename(str(archivo))
+
+def _contenido(archivo):
+    """Obtiene lo que se envía al proceso: los bytes de un archivo subido o la ruta."""
+    if not hasattr(archivo, 'read'):
+        return archivo
+    if hasattr(archivo, 'getvalue'):
+        return archivo.getvalue()
+    posicion = archivo.tell()
+    archivo.seek(0)
+    contenido = archivo.read()
+    archivo.seek(posicion)
+    return contenido
+
+def normalizar_tipos(df: pd.DataFrame, cliente_id: str) -> pd.DataFrame:
+    """Convierte a datetime64 una columna de fecha que mezcla fechas de Excel y textos.
+
+    Parquet no admite columnas con tipos mixtos: sin esto esos archivos nunca
+    quedarían en la caché. Se usa el mismo parser que el procesamiento, que
+    deja pasar sin cambios una columna que ya es datetime64.
+    """
+    col_fecha = obtener_esquema_cliente(cliente_id).get('Fecha Insert Lead')
+    if col_fecha not in df.columns or df[col_fecha].dtype != object:
+        return df
+    if df[col_fecha].dropna().map(lambda valor: isinstance(valor, str)).all():
+        return df
+    return df.assign(**{col_fecha: parsear_fechas(df[col_fecha], cliente_id)})
+
+def _cargar_y_cachear(contenido, cliente_id: str, ruta: str, directorio: str, tamano_maximo: int = None):
+    """Parsea un archivo (bytes o ruta) en un proceso del pool y lo guarda en la caché."""
+    archivo = io.BytesIO(contenido) if isinstance(contenido, bytes) else contenido
+    # Normalizado también cuando se devuelve: un acierto de caché debe dar lo mismo
+    df = normalizar_tipos(cargar_archivo(archivo, cliente_id), cliente_id)
+    _guardar_cache(df, ruta, directorio, tamano_maximo)
+    return df
+
+def cargar_archivos(archivos: list, cliente_id: str, max_workers: int = None, hashes: list = None,
+                    directorio: str = None, tamano_maximo: int = None):
+    """Carga varios archivos repartiendo el parseo entre procesos.
+
+    Los archivos que ya están en la caché se leen directamente; el resto se
+    parsea en un pool de procesos. Devuelve los DataFrames en el orden de
+    subida, cada fila con su Archivo_Origen, y la lista de errores por archivo
+    ({'archivo', 'error'}): un archivo con error no detiene a los demás.
+    """
+    directorio = directorio or DIRECTORIO_CACHE
+    dfs = [None] * len(archivos)
+    errores = {}
+
+    pendientes = []
+    for i, archivo in enumerate(archivos):
+        try:
+            hash_archivo = hashes[i] if hashes else hash_contenido(archivo)
+        except OSError as e:
+            errores[i] = str(e)
+            continue
+        ruta = ruta_cache(hash_archivo, cliente_id, directorio)
+        dfs[i] = _leer_cache(ruta)
+        if dfs[i] is None:
+            pendientes.append((i, ruta))
+
+    if len(pendientes) == 1 or max_workers == 1:
+        # Un solo archivo para parsear: no vale la pena levantar procesos
+        for i, ruta in pendientes:
+            try:
+                dfs[i] = _cargar_y_cachear(archivos[i], cliente_id, ruta, directorio, tamano_maximo)
+            except Exception as e:
+                errores[i] = str(e)
+    elif pendientes:
+        max_workers = min(max_workers or os.cpu_count() or 1, len(pendientes))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {
+                executor.submit(
+                    _cargar_y_cachear, _contenido(archivos[i]), cliente_id, ruta, directorio, tamano_maximo
+                ): i
+                for i, ruta in pendientes
+            }
+            for futuro in as_completed(futuros):
+                i = futuros[futuro]
+                try:
+                    dfs[i] = futuro.result()
+                except Exception as e:
+                    errores[i] = str(e)
+
+    cargados = [
+        df.assign(Archivo_Origen=nombre_archivo(archivo))
+        for archivo, df in zip(archivos, dfs) if df is not None
+    ]
+    return cargados, [
+        {'archivo': nombre_archivo(archivos[i]), 'error': errores[i]} for i in sorted(errores)
+    ]
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import sys
+from collections import OrderedDict
+
+import pandas as pd
+
+# Límites de la caché de resultados de cada sesión de la app
+MAX_ENTRADAS_SESION = 64
+MAX_MB_SESION = 1024
+
+# Claves de un grupo que no cambian su resultado (solo la forma de mostrarlo o exportarlo)
+CLAVES_PRESENTACION = ('activo',)
+
+def hash_objeto(objeto) -> str:
+    """Calcula un hash estable de una estructura de configuración (dict, list, str...)."""
+    texto = json.dumps(objeto, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+def clave_carga(hashes_archivos: list, cliente_id: str, opciones: dict) -> str:
+    """Clave del DataFrame cargado: archivos subidos (en orden), cliente y opciones de carga."""
+    return hash_objeto({'archivos': list(hashes_archivos), 'cliente': cliente_id, 'opciones': opciones})
+
+def _configuracion_regla(grupo: dict) -> dict:
+    return {clave: valor for clave, valor in grupo.items() if clave not in CLAVES_PRESENTACION}
+
+def claves_grupos(clave_datos: str, grupos: list, fecha_referencia, asignacion: str) -> list:
+    """Obtiene la clave del resultado de cada grupo.
+
+    En asignación superpuesta el resultado de un grupo solo depende de su
+    propia configuración; en exclusiva depende también de los demás grupos,
+    que pueden quitarle leads, así que cualquier cambio los invalida a todos.
+    """
+    comunes = {'datos': clave_datos, 'fecha': str(fecha_referencia), 'asignacion': asignacion}
+    if asignacion == 'exclusiva':
+        comunes['grupos'] = [_configuracion_regla(grupo) for grupo in grupos]
+    return [hash_objeto({**comunes, 'grupo': _configuracion_regla(grupo)}) for grupo in grupos]
+
+def tamano_mb(valor) -> float:
+    """Estima la memoria que ocupa un valor cacheado."""
+    if isinstance(valor, pd.DataFrame):
+        return valor.memory_usage(deep=True).sum() / 1024 ** 2
+    if isinstance(valor, (bytes, bytearray)):
+        return len(valor) / 1024 ** 2
+    if isinstance(valor, dict):
+        return sum(tamano_mb(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(tamano_mb(v) for v in valor)
+    return sys.getsizeof(valor) / 1024 ** 2
+
+class CacheLRU:
+    """Caché en memoria con desalojo de lo menos usado por cantidad y por tamaño."""
+
+    def __init__(self, max_entradas: int = MAX_ENTRADAS_SESION, max_mb: float = MAX_MB_SESION):
+        self.max_entradas = max_entradas
+        self.max_mb = max_mb
+        self._entradas = OrderedDict()
+        self._tamanos = {}
+        self.aciertos = 0
+        self.fallos = 0
+
+    def __contains__(self, clave) -> bool:
+        return clave in self._entradas
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def obtener(self, clave, por_defecto=None):
+        """Devuelve el valor cacheado y lo marca como recién usado."""
+        if clave not in self._entradas:
+            self.fallos += 1
+            return por_defecto
+        self.aciertos += 1
+        self._entradas.move_to_end(clave)
+        return self._entradas[clave]
+
+    def guardar(self, clave, valor):
+        """Guarda un valor y desaloja las entradas más antiguas si se superan los límites."""
+        self._entradas[clave] = valor
+        self._entradas.move_to_end(clave)
+        self._tamanos[clave] = tamano_mb(valor)
+        # La entrada recién guardada se conserva aunque supere el tamaño por sí sola
+        while len(self._entradas) > 1 and (
+            len(self._entradas) > self.max_entradas or sum(self._tamanos.values()) > self.max_mb
+        ):
+            antigua, _ = self._entradas.popitem(last=False)
+            del self._tamanos[antigua]
+        return valor
+
+    def limpiar(self):
+        self._entradas.clear()
+        self._tamanos.clear()
+
+    def tamano_total_mb(self) -> float:
+        return sum(self._tamanos.values())
@@ -1,9 +1,44 @@
+import os
 from datetime import datetime
 
+# Directorio de los datos que deben persistir entre ejecuciones (almacén de
+# leads, índice de supresión); fuera del directorio temporal del sistema
+DIRECTORIO_DATOS = os.environ.get(
+    'SEGMENTACION_DATOS_DIR',
+    os.path.join(os.path.expanduser('~'), '.segmentacion_leads')
+)
+
+# Tipo con el que se lee cada columna estandarizada del archivo de origen.
+# None conserva el tipo nativo (p. ej. las fechas de Excel ya vienen como fecha).
+TIPOS_COLUMNAS = {
+    'Nombre': str,
+    'Email': str,
+    'Tel': str,
+    'Programa': str,
+    'Resolución': str,
+    'Fecha Insert Lead': None
+}
+
 # Configuración de clientes
+# 'esquema' indica qué columna del archivo de origen alimenta cada columna estandarizada;
+# solo esas columnas se leen de los archivos
+# Cada grupo puede definir 'formato_salida': 'xlsx' (por defecto), 'csv' o 'parquet'
+# y 'dias_enfriamiento': días en los que no se vuelve a exportar un mismo contacto
+# 'asignacion' del cliente: 'superpuesta' (por defecto, un lead puede estar en varios grupos)
+# o 'exclusiva' (cada lead va solo al grupo de menor 'prioridad'; sin prioridad, el orden de la lista)
+# 'codigos_programa': código de cada programa, agregado como columna 'Cod_Programa'; los nombres
+# que no coinciden (ni normalizados ni por parecido) reciben 'codigo_programa_otros' y se informan
 CLIENTES = {
     'CREXE': {
         'nombre': 'CREXE',
+        'esquema': {
+            'Nombre': 'Nombre',
+            'Email': 'Email',
+            'Tel': 'Tel',
+            'Programa': 'Programa',
+            'Resolución': 'Resolución',
+            'Fecha Insert Lead': 'Fecha Insert Lead'
+        },
         'grupos': [
             {
                 'nombre': 'Se brinda info',
@@ -56,6 +91,7 @@ CLIENTES = {
                 'filtro_resolucion': True,
                 'filtro_fecha': False,
                 'dias_antes': None,
+                'dias_enfriamiento': 7,
                 'columnas_salida': {
                     'Nombre': 'Nombre',
                     'Apellido': 'Apellido',
@@ -71,6 +107,7 @@ CLIENTES = {
                 'filtro_resolucion': True,
                 'filtro_fecha': True,
                 'dias_antes': [0, 1],
+                'dias_enfriamiento': 7,
                 'columnas_salida': {
                     'Nombre': 'Nombre',
                     'Apellido': 'Apellido',
@@ -84,6 +121,14 @@ CLIENTES = {
     },
     'UNAB': {
         'nombre': 'UNAB',
+        'esquema': {
+            'Nombre': 'Nombre',
+            'Email': 'Email',
+            'Tel': 'Tel',
+            'Programa': 'Programa',
+            'Resolución': 'Resolución',
+            'Fecha Insert Lead': 'Fecha Insert Lead'
+        },
         'grupos': [
             {
                 'nombre': 'Bienvenida',
@@ -112,6 +157,7 @@ CLIENTES = {
                 'filtro_resolucion': True,
                 'filtro_fecha': False,
                 'dias_antes': None,
+                'dias_enfriamiento': 7,
                 'columnas_salida': {
                     'Nombre': 'Nombre',
                     'Apellido': 'Apellido',
@@ -125,6 +171,14 @@ CLIENTES = {
     },
     'ULINEA': {
         'nombre': 'ULINEA',
+        'esquema': {
+            'Nombre': 'Nombre',
+            'Email': 'Email',
+            'Tel': 'Tel',
+            'Programa': 'Programa',
+            'Resolución': 'Ultima Resolución',
+            'Fecha Insert Lead': 'Fecha Insert Lead'
+        },
         'grupos': [
             {
                 'nombre': 'Bienvenida',
@@ -145,6 +199,14 @@ CLIENTES = {
     },
     'ANAHUAC': {
         'nombre': 'ANAHUAC',
+        'esquema': {
+            'Nombre': 'Nombre',
+            'Email': 'Email',
+            'Tel': 'Tel',
+            'Programa': 'Programa',
+            'Resolución': 'Ultima Resolución',
+            'Fecha Insert Lead': 'Fecha Insert Lead'
+        },
         'grupos': [
             {
                 'nombre': 'Bienvenida',
@@ -165,6 +227,20 @@ CLIENTES = {
     },
     'PK_CBA': {
         'nombre': 'PK CBA',
+        'esquema': {
+            'Nombre': 'Nombre',
+            'Email': 'e-Mail',
+            'Tel': 'Móvil',
+            'Programa': 'Carrera de Interes',
+            'Resolución': 'Resolución',
+            'Fecha Insert Lead': 'Fecha Insert Lead'
+        },
+        'codigos_programa': {
+            'Abogacía': '1',
+            'Tecnicatura Universitaria en Martillero Público y Corredor': '2',
+            'Licenciatura en Psicopedagogía': '3'
+        },
+        'codigo_programa_otros': '4',
         'grupos': [
             {
                 'nombre': 'Bienvenida',
@@ -191,4 +267,12 @@ def obtener_configuracion_cliente(cliente_id: str) -> dict:
 
 def obtener_lista_clientes() -> list:
     """Obtiene la lista de clientes disponibles."""
-    return list(CLIENTES.keys()) 
\ No newline at end of file
+    return list(CLIENTES.keys()) 
+
+def obtener_esquema_cliente(cliente_id: str) -> dict:
+    """Obtiene el esquema de columnas de origen de un cliente."""
+    return CLIENTES.get(cliente_id, {}).get('esquema', {})
+
+def obtener_codigos_programa(cliente_id: str) -> dict:
+    """Obtiene la tabla de códigos de programa de un cliente (vacía si no tiene)."""
+    return CLIENTES.get(cliente_id, {}).get('codigos_programa', {})
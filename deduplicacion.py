@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# Claves disponibles: columnas estandarizadas que identifican un contacto
+CLAVES_DUPLICADOS = {
+    'telefono': ['Tel'],
+    'email': ['Email'],
+    'telefono_email': ['Tel', 'Email'],
+}
+
+# Políticas para elegir qué registro conservar entre los duplicados
+POLITICAS_CONSERVAR = ('mas_reciente', 'primero', 'ultimo')
+
+def normalizar_clave(df: pd.DataFrame, clave: str = 'telefono') -> pd.DataFrame:
+    """Obtiene las columnas normalizadas que forman la clave de contacto."""
+    if clave not in CLAVES_DUPLICADOS:
+        raise ValueError(f"Clave de duplicados no soportada: {clave}")
+
+    columnas = {}
+    for col in CLAVES_DUPLICADOS[clave]:
+        serie = df[col] if col in df.columns else pd.Series('', index=df.index)
+        serie = serie.fillna('').astype(str)
+        if col == 'Tel':
+            # Tel ya queda solo con dígitos tras procesar_cliente_especifico
+            serie = serie.str.lstrip('0')
+        else:
+            serie = serie.str.strip().str.lower()
+        columnas[col] = serie
+    return pd.DataFrame(columnas, index=df.index)
+
+def hash_clave(df: pd.DataFrame, clave: str = 'telefono') -> pd.Series:
+    """Calcula un hash de 64 bits de la clave de contacto por fila.
+
+    Las filas con la clave vacía se excluyen para no agruparlas entre sí.
+    """
+    columnas = normalizar_clave(df, clave)
+    hashes = pd.Series(pd.util.hash_pandas_object(columnas, index=False).to_numpy(), index=df.index)
+    return hashes[(columnas != '').any(axis=1)]
+
+def marcar_duplicados(df: pd.DataFrame, clave: str = 'telefono', conservar: str = 'mas_reciente') -> np.ndarray:
+    """Marca con True los registros duplicados que deben descartarse."""
+    if conservar not in POLITICAS_CONSERVAR:
+        raise ValueError(f"Política de duplicados no soportada: {conservar}")
+
+    # Trabajar por posición para no depender de que el índice sea único
+    df = df.reset_index(drop=True)
+    hashes = hash_clave(df, clave)
+
+    if conservar == 'mas_reciente' and 'Fecha_Lead' in df.columns:
+        # De la más reciente a la más antigua; en empate gana la primera subida
+        orden = df['Fecha_Lead'].loc[hashes.index].sort_values(ascending=False, kind='stable').index
+        duplicados = hashes.loc[orden].duplicated(keep='first')
+    else:
+        duplicados = hashes.duplicated(keep='last' if conservar == 'ultimo' else 'first')
+
+    marca = np.zeros(len(df), dtype=bool)
+    marca[duplicados.index[duplicados.to_numpy()]] = True
+    return marca
+
+def eliminar_duplicados(df: pd.DataFrame, clave: str = 'telefono', conservar: str = 'mas_reciente'):
+    """Elimina los registros duplicados por teléfono y/o email.
+
+    Devuelve el DataFrame sin duplicados y la cantidad de duplicados que
+    aportó cada archivo de origen (columna 'Archivo_Origen', si existe).
+    """
+    marca = marcar_duplicados(df, clave, conservar)
+    if 'Archivo_Origen' in df.columns:
+        reporte = df['Archivo_Origen'][marca].value_counts()
+    else:
+        reporte = pd.Series({'': int(marca.sum())}, dtype='int64')
+    reporte = reporte[reporte > 0].rename('Duplicados')
+    return df[~marca], reporte
@@ -0,0 +1,53 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Hilos para preparar en segundo plano los archivos de descarga
+MAX_HILOS_DESCARGAS = 2
+
+def crear_ejecutor(max_workers: int = MAX_HILOS_DESCARGAS) -> ThreadPoolExecutor:
+    """Crea el ejecutor compartido que prepara los archivos en segundo plano."""
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='descargas')
+
+class ArchivoDiferido:
+    """Archivo de descarga que se genera una sola vez: al pedirlo o en segundo plano.
+
+    generar es la función que produce los bytes (p. ej. generar_archivo_descarga)
+    y se llama con los argumentos indicados; el resultado queda memorizado.
+    """
+
+    def __init__(self, generar, *argumentos):
+        self._generar = generar
+        self._argumentos = argumentos
+        self._bytes = None
+        self._futuro = None
+        self._candado = threading.Lock()
+
+    def precalcular(self, ejecutor):
+        """Encarga la generación al ejecutor si todavía no se hizo ni se pidió."""
+        with self._candado:
+            if self._bytes is None and self._futuro is None:
+                self._futuro = ejecutor.submit(self._generar, *self._argumentos)
+        return self
+
+    def listo(self) -> bool:
+        """Indica si los bytes ya están disponibles sin esperar."""
+        futuro = self._futuro
+        return self._bytes is not None or (futuro is not None and futuro.done() and futuro.exception() is None)
+
+    def obtener(self) -> bytes:
+        """Devuelve los bytes, esperando al trabajo en curso o generándolos en el momento."""
+        with self._candado:
+            if self._bytes is None:
+                futuro, self._futuro = self._futuro, None
+                try:
+                    self._bytes = futuro.result() if futuro is not None else None
+                except Exception:
+                    # Si falló en segundo plano se reintenta aquí para mostrar el error real
+                    self._bytes = None
+                if self._bytes is None:
+                    self._bytes = self._generar(*self._argumentos)
+            return self._bytes
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + (sys.getsizeof(self._bytes) if self._bytes is not None else 0)
@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+# Formatos conocidos de 'Fecha Insert Lead', en orden de preferencia
+FORMATOS_FECHA = [
+    '%d-%m-%Y %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S',
+    '%d-%m-%Y %H:%M',
+    '%d/%m/%Y %H:%M',
+    '%Y-%m-%d %H:%M',
+    '%d-%m-%Y',
+    '%d/%m/%Y',
+    '%Y-%m-%d',
+]
+
+# Archivo donde se recuerda el formato detectado de cada cliente
+ARCHIVO_FORMATOS = os.path.join(
+    os.environ.get('SEGMENTACION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'segmentacion_leads_cache')),
+    'formatos_fecha.json'
+)
+
+# Desplazamiento horario al final de una hora ('22:00-05:00', '10:15:00.5Z', '08:00 +0300')
+PATRON_DESPLAZAMIENTO = r'(\d:\d\d(?::\d\d)?(?:\.\d+)?)\s*(?:Z|UTC|GMT|[+-]\d\d(?::?\d\d)?)$'
+
+# Proporción mínima de la muestra que debe reconocer el formato cacheado
+UMBRAL_FORMATO_CACHEADO = 0.5
+
+_formatos_cliente = {}
+
+def _cargar_formatos() -> dict:
+    """Carga los formatos cacheados por cliente desde disco."""
+    if not _formatos_cliente and os.path.exists(ARCHIVO_FORMATOS):
+        try:
+            with open(ARCHIVO_FORMATOS, encoding='utf-8') as f:
+                _formatos_cliente.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return _formatos_cliente
+
+def _guardar_formato(cliente_id: str, formato: str):
+    """Guarda el formato detectado de un cliente en memoria y en disco."""
+    formatos = _cargar_formatos()
+    if formatos.get(cliente_id) == formato:
+        return
+    formatos[cliente_id] = formato
+    try:
+        os.makedirs(os.path.dirname(ARCHIVO_FORMATOS), exist_ok=True)
+        temporal = f"{ARCHIVO_FORMATOS}.{os.getpid()}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(formatos, f)
+        os.replace(temporal, ARCHIVO_FORMATOS)
+    except OSError:
+        pass
+
+def formato_cacheado(cliente_id: str):
+    """Obtiene el formato de fecha recordado para el cliente, si existe."""
+    return _cargar_formatos().get(cliente_id)
+
+def _muestra(serie: pd.Series, tamano: int) -> pd.Series:
+    """Toma una muestra reproducible de los valores de texto no nulos."""
+    no_nulos = serie.dropna()
+    if len(no_nulos) > tamano:
+        no_nulos = no_nulos.sample(tamano, random_state=0)
+    return no_nulos[no_nulos.map(lambda valor: isinstance(valor, str))]
+
+def _reconocidas(muestra: pd.Series, formato: str) -> int:
+    """Cuenta cuántos valores de la muestra reconoce el formato."""
+    return int(pd.to_datetime(muestra, format=formato, errors='coerce').notna().sum())
+
+def inferir_formato(serie: pd.Series, formatos: list = None, tamano_muestra: int = 1000):
+    """Detecta el formato dominante a partir de una muestra de la serie."""
+    formatos = formatos or FORMATOS_FECHA
+    muestra = _muestra(serie, tamano_muestra)
+    if muestra.empty:
+        return None
+    conteos = {formato: _reconocidas(muestra, formato) for formato in formatos}
+    mejor = max(formatos, key=lambda formato: conteos[formato])
+    return mejor if conteos[mejor] > 0 else None
+
+def parsear_fechas(serie: pd.Series, cliente_id: str = None, formatos: list = None) -> pd.Series:
+    """Convierte la serie a fechas con el formato dominante y reintenta solo las fallidas.
+
+    El formato dominante se parsea en una sola pasada vectorizada. Las filas
+    que no lo cumplen se prueban con el resto de los formatos y, al final,
+    con el parser genérico. El formato detectado se recuerda por cliente.
+    """
+    if isinstance(serie.dtype, pd.DatetimeTZDtype):
+        # La hora local del lead decide su día: se quita la zona sin convertir
+        return serie.dt.tz_localize(None)
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    formatos = formatos or FORMATOS_FECHA
+    formato = formato_cacheado(cliente_id) if cliente_id else None
+    if formato is not None:
+        # Validar el formato cacheado con una muestra chica antes de usarlo
+        muestra = _muestra(serie, 100)
+        if not muestra.empty and _reconocidas(muestra, formato) < UMBRAL_FORMATO_CACHEADO * len(muestra):
+            formato = None
+    if formato is None:
+        formato = inferir_formato(serie, formatos)
+        if formato is not None and cliente_id:
+            _guardar_formato(cliente_id, formato)
+
+    if formato is not None:
+        resultado = pd.to_datetime(serie, format=formato, errors='coerce')
+    else:
+        resultado = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+
+    # Reintentar solo las filas que fallaron
+    for alternativo in [f for f in formatos if f != formato]:
+        fallidas = resultado.isna() & serie.notna()
+        if not fallidas.any():
+            return resultado
+        resultado[fallidas] = pd.to_datetime(serie[fallidas], format=alternativo, errors='coerce')
+
+    fallidas = resultado.isna() & serie.notna()
+    if fallidas.any():
+        # Se descarta el desplazamiento y se conserva la hora local: pasar a UTC
+        # movería de día a los leads de la noche ('2024-03-05 22:00-05:00')
+        sin_zona = serie[fallidas].astype(str).str.strip().str.replace(PATRON_DESPLAZAMIENTO, r'\1', regex=True)
+        resultado[fallidas] = pd.to_datetime(sin_zona, format='mixed', dayfirst=True, errors='coerce')
+    return resultado
@@ -0,0 +1,179 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Historial de segundos por fila de cada etapa, usado para estimar el progreso
+ARCHIVO_HISTORIAL = os.path.join(
+    os.environ.get('SEGMENTACION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'segmentacion_leads_cache')),
+    'tiempos_etapas.json'
+)
+
+# Intervalo de muestreo de la memoria del proceso, en segundos
+INTERVALO_MUESTREO = 0.01
+
+def memoria_proceso_mb():
+    """Obtiene la memoria residente actual del proceso en MB (None si no se puede medir)."""
+    try:
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # ru_maxrss es el máximo histórico (KB en Linux, bytes en macOS)
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maximo / 1024 ** 2 if os.uname().sysname == 'Darwin' else maximo / 1024
+    except (ImportError, AttributeError):
+        return None
+
+class _MuestreoMemoria:
+    """Registra el pico de memoria del proceso mientras dura una etapa."""
+
+    def __init__(self, intervalo: float = INTERVALO_MUESTREO):
+        self.intervalo = intervalo
+        self.pico = memoria_proceso_mb()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+
+    def _muestrear(self):
+        while not self._detener.wait(self.intervalo):
+            actual = memoria_proceso_mb()
+            if actual is not None and (self.pico is None or actual > self.pico):
+                self.pico = actual
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._detener.set()
+        self._hilo.join()
+        actual = memoria_proceso_mb()
+        if actual is not None and (self.pico is None or actual > self.pico):
+            self.pico = actual
+        return self.pico
+
+class MedicionPipeline:
+    """Mide tiempo, filas y pico de memoria de cada etapa de una ejecución.
+
+    El progreso se estima con los tiempos reales de las etapas terminadas y,
+    para las pendientes, con los segundos por fila de la ejecución anterior.
+    """
+
+    def __init__(self, cliente_id: str, etapas_previstas: list, filas_estimadas: int = None,
+                 al_avanzar=None, archivo_historial: str = None):
+        self.cliente_id = cliente_id
+        self.etapas_previstas = list(etapas_previstas)
+        self.filas_estimadas = filas_estimadas
+        self.al_avanzar = al_avanzar
+        self.archivo_historial = archivo_historial or ARCHIVO_HISTORIAL
+        self.inicio = datetime.now()
+        self.registros = []
+        self._historial = self._cargar_historial()
+
+    def _cargar_historial(self) -> dict:
+        try:
+            with open(self.archivo_historial, encoding='utf-8') as f:
+                return json.load(f).get(self.cliente_id, {})
+        except (OSError, ValueError):
+            return {}
+
+    def _estimacion(self, etapa: str):
+        """Estima la duración de una etapa pendiente a partir del historial."""
+        segundos_por_fila = self._historial.get(etapa)
+        if segundos_por_fila is None or not self.filas_estimadas:
+            return None
+        return segundos_por_fila * self.filas_estimadas
+
+    def progreso(self) -> float:
+        """Fracción completada según los tiempos medidos y estimados."""
+        terminadas = {registro['etapa'] for registro in self.registros}
+        pendientes = [etapa for etapa in self.etapas_previstas if etapa not in terminadas]
+        if not pendientes:
+            return 1.0
+
+        medido = sum(registro['segundos'] for registro in self.registros)
+        estimaciones = [self._estimacion(etapa) for etapa in pendientes]
+        conocidas = [e for e in estimaciones if e is not None]
+        # Sin historial, cada etapa pendiente cuenta como el promedio de las conocidas
+        referencia = (sum(conocidas) / len(conocidas) if conocidas
+                      else medido / len(self.registros) if self.registros else 1.0)
+        restante = sum(referencia if e is None else e for e in estimaciones)
+        total = medido + restante
+        return min(medido / total, 1.0) if total > 0 else 0.0
+
+    def iniciar(self, etapa: str, filas_entrada: int = None) -> dict:
+        """Comienza a medir una etapa y devuelve su registro."""
+        return {
+            'etapa': etapa,
+            'filas_entrada': filas_entrada,
+            'filas_salida': None,
+            '_inicio': time.perf_counter(),
+            '_muestreo': _MuestreoMemoria().iniciar(),
+        }
+
+    def finalizar(self, registro: dict):
+        """Termina la medición de una etapa y actualiza el progreso."""
+        registro['segundos'] = round(time.perf_counter() - registro.pop('_inicio'), 6)
+        pico = registro.pop('_muestreo').detener()
+        registro['memoria_pico_mb'] = None if pico is None else round(pico, 1)
+        self.registros.append(registro)
+        # Sin estimación previa, la primera etapa con filas define el tamaño de la ejecución
+        if not self.filas_estimadas and registro['filas_salida']:
+            self.filas_estimadas = registro['filas_salida']
+        if self.al_avanzar:
+            self.al_avanzar(self.progreso(), registro['etapa'])
+
+    @contextmanager
+    def etapa(self, etapa: str, filas_entrada: int = None):
+        """Mide el bloque como una etapa; el bloque puede completar 'filas_salida'."""
+        registro = self.iniciar(etapa, filas_entrada)
+        try:
+            yield registro
+        finally:
+            self.finalizar(registro)
+
+    def guardar_historial(self):
+        """Guarda los segundos por fila de cada etapa para estimar la próxima ejecución."""
+        filas = self.filas_estimadas
+        if not filas:
+            return
+        try:
+            with open(self.archivo_historial, encoding='utf-8') as f:
+                historial = json.load(f)
+        except (OSError, ValueError):
+            historial = {}
+        historial.setdefault(self.cliente_id, {}).update({
+            registro['etapa']: registro['segundos'] / filas for registro in self.registros
+        })
+        try:
+            os.makedirs(os.path.dirname(self.archivo_historial), exist_ok=True)
+            temporal = f"{self.archivo_historial}.{os.getpid()}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(historial, f)
+            os.replace(temporal, self.archivo_historial)
+        except OSError:
+            pass
+
+    def a_dict(self) -> dict:
+        """Obtiene las métricas de la ejecución."""
+        return {
+            'cliente': self.cliente_id,
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'filas': self.filas_estimadas,
+            'segundos_total': round(sum(registro['segundos'] for registro in self.registros), 6),
+            'memoria_pico_mb': max(
+                (registro['memoria_pico_mb'] for registro in self.registros if registro['memoria_pico_mb'] is not None),
+                default=None
+            ),
+            'etapas': self.registros,
+        }
+
+    def a_json(self) -> str:
+        """Serializa las métricas de la ejecución como JSON."""
+        return json.dumps(self.a_dict(), ensure_ascii=False, indent=2, default=str)
@@ -1,6 +1,23 @@
+import numpy as np
 import pandas as pd
 import re
 import io
+import codecs
+import csv
+import difflib
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, nullcontext
+from functools import lru_cache
+from itertools import islice
+from openpyxl import Workbook
+from fechas import parsear_fechas
+from config_clientes import (
+    TIPOS_COLUMNAS, obtener_configuracion_cliente, obtener_esquema_cliente, obtener_codigos_programa
+)
+from segmentacion import canonizar_texto
 
 def limpiar_nombre(nombre: str) -> str:
     """Limpia y formatea el nombre."""
@@ -46,6 +63,144 @@ def limpiar_resolucion(resolucion: str) -> str:
     
     return resolucion
 
+# ====================
+# LIMPIEZA VECTORIZADA
+# ====================
+# Equivalentes por columna de las funciones limpiar_* anteriores, que se
+# mantienen como implementación de referencia. Operan con los accesores .str
+# de pandas en lugar de una llamada de Python por fila.
+
+@lru_cache(maxsize=1)
+def _patron_no_digitos() -> re.Pattern:
+    """Patrón que elimina todo lo que str.isdigit no considera dígito."""
+    # str.isdigit acepta además de \d caracteres como '²' o '①'
+    extras = ''.join(
+        chr(c) for c in range(sys.maxunicode + 1)
+        if chr(c).isdigit() and not re.match(r'\d', chr(c))
+    )
+    return re.compile(f"[^\\d{re.escape(extras)}]+")
+
+def _como_texto(serie: pd.Series) -> pd.Series:
+    """Convierte la serie a texto dejando '' en los valores nulos."""
+    nulos = serie.isna()
+    texto = serie.astype(object).where(~nulos, '')
+    return texto.astype(str)
+
+def limpiar_nombre_vectorizado(serie: pd.Series) -> pd.Series:
+    """Versión vectorizada de limpiar_nombre."""
+    primera = _como_texto(serie).str.split(n=1).str[0]
+    # Los nombres vacíos o solo con espacios quedan como ''
+    return primera.fillna('').str.capitalize()
+
+def limpiar_telefono_vectorizado(serie: pd.Series) -> pd.Series:
+    """Versión vectorizada de limpiar_telefono."""
+    return _como_texto(serie).str.replace(_patron_no_digitos(), '', regex=True)
+
+def limpiar_email_vectorizado(serie: pd.Series) -> pd.Series:
+    """Versión vectorizada de limpiar_email."""
+    return _como_texto(serie).str.lower().str.strip()
+
+def limpiar_programa_vectorizado(serie: pd.Series) -> pd.Series:
+    """Versión vectorizada de limpiar_programa."""
+    return _como_texto(serie).str.strip()
+
+# Plan de limpieza por columna estandarizada
+LIMPIEZA_VECTORIZADA = {
+    'Nombre': limpiar_nombre_vectorizado,
+    'Email': limpiar_email_vectorizado,
+    'Tel': limpiar_telefono_vectorizado,
+    'Programa': limpiar_programa_vectorizado,
+    'Resolución': limpiar_programa_vectorizado,
+}
+
+# ====================
+# TIPOS COMPACTOS
+# ====================
+# Columnas con pocos valores distintos como categorías y el resto como
+# strings respaldados por Arrow en lugar de objetos de Python
+TIPOS_COMPACTOS = {
+    'Nombre': 'string[pyarrow]',
+    'Email': 'string[pyarrow]',
+    'Tel': 'string[pyarrow]',
+    'Programa': 'category',
+    'Resolución': 'category',
+    'Archivo_Origen': 'category',
+    'Cod_Programa': 'category',
+}
+
+def compactar_tipos(df: pd.DataFrame) -> pd.DataFrame:
+    """Convierte las columnas estandarizadas a tipos compactos."""
+    tipos = {col: tipo for col, tipo in TIPOS_COMPACTOS.items() if col in df.columns}
+    return df.astype(tipos)
+
+def memoria_mb(df: pd.DataFrame) -> float:
+    """Calcula la memoria ocupada por el DataFrame en MB (incluye el contenido de los strings)."""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+# ====================
+# CÓDIGOS DE PROGRAMA
+# ====================
+# Cada programa distinto se busca una sola vez en la tabla del cliente
+# (config_clientes): tal cual, normalizado y, por último, por parecido. El
+# resultado se recuerda por cliente y se aplica a las filas con los códigos
+# de la categoría.
+
+# Similitud mínima (difflib) para aceptar un programa parecido
+UMBRAL_PARECIDO_PROGRAMA = 0.85
+
+_codigos_programa_cliente = {}
+
+def buscar_codigo_programa(programa: str, tabla: dict):
+    """Busca el código de un programa: exacto, normalizado o parecido (None si no hay)."""
+    if programa in tabla:
+        return tabla[programa]
+    normalizados = {canonizar_texto(nombre): codigo for nombre, codigo in tabla.items()}
+    normalizado = canonizar_texto(programa)
+    if normalizado in normalizados:
+        return normalizados[normalizado]
+    parecidos = difflib.get_close_matches(normalizado, list(normalizados), n=1, cutoff=UMBRAL_PARECIDO_PROGRAMA)
+    return normalizados[parecidos[0]] if parecidos else None
+
+def codigos_programas(programas, cliente_id: str) -> list:
+    """Obtiene el código de cada programa distinto, buscando solo los que el cliente no tenía."""
+    tabla = obtener_codigos_programa(cliente_id)
+    cache = _codigos_programa_cliente.setdefault(cliente_id, {})
+    for programa in programas:
+        if programa not in cache:
+            cache[programa] = buscar_codigo_programa(programa, tabla) if programa else None
+    return [cache[programa] for programa in programas]
+
+def _codigos_y_valores(serie: pd.Series):
+    """Códigos enteros por valor distinto (los de la categoría, si ya lo es)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), list(serie.cat.categories)
+    codigos, valores = pd.factorize(serie)
+    return codigos, list(valores)
+
+def asignar_codigo_programa(serie: pd.Series, cliente_id: str) -> pd.Series:
+    """Obtiene el código de programa de cada lead con un solo mapeo sobre los códigos de categoría.
+
+    Los programas sin código reciben 'codigo_programa_otros' del cliente ('' si no tiene).
+    """
+    otros = obtener_configuracion_cliente(cliente_id).get('codigo_programa_otros', '')
+    codigos, programas = _codigos_y_valores(serie)
+    por_programa = [otros if codigo is None else codigo for codigo in codigos_programas(programas, cliente_id)]
+    codigos_resultado, resultados = pd.factorize(pd.Series(por_programa, dtype=object))
+    if len(codigos_resultado):
+        codigos = np.where(codigos >= 0, codigos_resultado[codigos], -1)
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=resultados), index=serie.index, name='Cod_Programa')
+
+def programas_sin_codigo(df: pd.DataFrame, cliente_id: str) -> pd.Series:
+    """Cuenta los leads de cada programa que no se encontró en la tabla del cliente."""
+    if not obtener_codigos_programa(cliente_id) or 'Programa' not in df.columns:
+        return pd.Series(dtype='int64', name='Leads')
+    codigos, programas = _codigos_y_valores(df['Programa'])
+    conteos = np.bincount(codigos[codigos >= 0], minlength=len(programas))
+    reporte = pd.Series(conteos, index=pd.Index(programas, name='Programa'), name='Leads')
+    sin_codigo = [programa != '' and codigo is None for programa, codigo in zip(programas, codigos_programas(programas, cliente_id))]
+    reporte = reporte[np.asarray(sin_codigo, dtype=bool) & (reporte.to_numpy() > 0)]
+    return reporte.sort_values(ascending=False)
+
 def procesar_ulinea_anahuac(df: pd.DataFrame) -> pd.DataFrame:
     """Procesa el DataFrame para ULINEA y ANAHUAC."""
     # Limpiar nombres
@@ -84,13 +239,9 @@ def procesar_pk_cba(df: pd.DataFrame) -> pd.DataFrame:
     if 'Carrera de Interes' in df.columns:
         df['Carrera de Interes'] = df['Carrera de Interes'].apply(limpiar_programa)
     
-    # Agregar Cod_Programa
+    # Agregar Cod_Programa según la tabla del cliente
     if 'Carrera de Interes' in df.columns:
-        df['Cod_Programa'] = df['Carrera de Interes'].apply(lambda x: {
-            'Abogacía': '1',
-            'Tecnicatura Universitaria en Martillero Público y Corredor': '2',
-            'Licenciatura en Psicopedagogía': '3'
-        }.get(x, '4'))
+        df['Cod_Programa'] = asignar_codigo_programa(df['Carrera de Interes'], 'PK_CBA')
     
     return df
 
@@ -123,134 +274,496 @@ def procesar_cliente_especifico(df: pd.DataFrame, cliente_id: str) -> pd.DataFra
     # Crear una copia del DataFrame para no modificar el original
     df_procesado = df.copy()
     
-    # Mapeo de columnas según el cliente
-    mapeo_columnas = {
-        'ULINEA': {
-            'Nombre': 'Nombre',
-            'Email': 'Email',
-            'Tel': 'Tel',
-            'Programa': 'Programa',
-            'Resolución': 'Ultima Resolución',
-            'Fecha Insert Lead': 'Fecha Insert Lead'
-        },
-        'ANAHUAC': {
-            'Nombre': 'Nombre',
-            'Email': 'Email',
-            'Tel': 'Tel',
-            'Programa': 'Programa',
-            'Resolución': 'Ultima Resolución',
-            'Fecha Insert Lead': 'Fecha Insert Lead'
-        },
-        'PK_CBA': {
-            'Nombre': 'Nombre',
-            'Email': 'e-Mail',
-            'Tel': 'Móvil',
-            'Programa': 'Carrera de Interes',
-            'Resolución': 'Resolución',
-            'Fecha Insert Lead': 'Fecha Insert Lead'
-        },
-        'CREXE': {
-            'Nombre': 'Nombre',
-            'Email': 'Email',
-            'Tel': 'Tel',
-            'Programa': 'Programa',
-            'Resolución': 'Resolución',
-            'Fecha Insert Lead': 'Fecha Insert Lead'
-        },
-        'UNAB': {
-            'Nombre': 'Nombre',
-            'Email': 'Email',
-            'Tel': 'Tel',
-            'Programa': 'Programa',
-            'Resolución': 'Resolución',
-            'Fecha Insert Lead': 'Fecha Insert Lead'
-        }
-    }
-    
-    # Obtener el mapeo específico para el cliente
-    mapeo = mapeo_columnas.get(cliente_id, {})
+    # Obtener el esquema de columnas del cliente
+    mapeo = obtener_esquema_cliente(cliente_id)
     
-    # Crear un nuevo DataFrame con las columnas estandarizadas
-    df_estandarizado = pd.DataFrame()
+    # Crear un nuevo DataFrame con las columnas estandarizadas (mismo índice que el original)
+    df_estandarizado = pd.DataFrame(index=df_procesado.index)
     
     # Copiar y procesar cada columna según el mapeo
     for col_destino, col_origen in mapeo.items():
         if col_origen in df_procesado.columns:
-            if col_destino == 'Nombre':
-                df_estandarizado[col_destino] = df_procesado[col_origen].apply(limpiar_nombre)
-            elif col_destino == 'Email':
-                df_estandarizado[col_destino] = df_procesado[col_origen].apply(limpiar_email)
-            elif col_destino == 'Tel':
-                df_estandarizado[col_destino] = df_procesado[col_origen].apply(limpiar_telefono)
-            elif col_destino == 'Programa':
-                df_estandarizado[col_destino] = df_procesado[col_origen].apply(limpiar_programa)
-            elif col_destino == 'Resolución':
-                df_estandarizado[col_destino] = df_procesado[col_origen].apply(lambda x: str(x).strip() if pd.notna(x) else '')
+            if col_destino in LIMPIEZA_VECTORIZADA:
+                df_estandarizado[col_destino] = LIMPIEZA_VECTORIZADA[col_destino](df_procesado[col_origen])
             elif col_destino == 'Fecha Insert Lead':
-                # Intentar diferentes formatos de fecha
-                try:
-                    df_estandarizado['Fecha_Lead'] = pd.to_datetime(
-                        df_procesado[col_origen],
-                        format='%d-%m-%Y %H:%M:%S',
-                        errors='coerce'
-                    )
-                except:
-                    try:
-                        df_estandarizado['Fecha_Lead'] = pd.to_datetime(
-                            df_procesado[col_origen],
-                            format='%Y-%m-%d %H:%M:%S',
-                            errors='coerce'
-                        )
-                    except:
-                        df_estandarizado['Fecha_Lead'] = pd.to_datetime(
-                            df_procesado[col_origen],
-                            errors='coerce'
-                        )
+                # Formato dominante en una pasada y alternativos solo para las filas fallidas
+                df_estandarizado['Fecha_Lead'] = parsear_fechas(df_procesado[col_origen], cliente_id)
         else:
             if col_destino == 'Fecha Insert Lead':
                 df_estandarizado['Fecha_Lead'] = pd.NaT
             else:
                 df_estandarizado[col_destino] = ''
     
+    # Conservar el archivo de origen de cada registro, si se etiquetó al cargar
+    if 'Archivo_Origen' in df_procesado.columns:
+        df_estandarizado['Archivo_Origen'] = df_procesado['Archivo_Origen']
+    
+    df_estandarizado = compactar_tipos(df_estandarizado)
+
+    # Código de programa para los clientes con tabla de programas
+    if obtener_codigos_programa(cliente_id) and 'Programa' in df_estandarizado.columns:
+        df_estandarizado['Cod_Programa'] = asignar_codigo_programa(df_estandarizado['Programa'], cliente_id)
+
     return df_estandarizado
 
+def separar_fechas_invalidas(df: pd.DataFrame):
+    """Separa los registros cuya fecha no se reconoció.
+
+    Devuelve los registros válidos y los omitidos (vacío si no hay Fecha_Lead).
+    Todas las entradas (app, lotes, bloques, servicio) los descartan igual.
+    """
+    if 'Fecha_Lead' not in df.columns:
+        return df, df.iloc[:0]
+    invalidas = df['Fecha_Lead'].isna().to_numpy()
+    if not invalidas.any():
+        return df, df.iloc[:0]
+    return df[~invalidas], df[invalidas]
+
+# Tamaño de la muestra usada para detectar el encoding de los CSV
+TAMANO_MUESTRA_ENCODING = 1024 * 1024
+
+def _leer_muestra(archivo, tamano: int) -> bytes:
+    """Lee los primeros bytes del archivo sin mover su posición."""
+    if hasattr(archivo, 'read'):
+        posicion = archivo.tell()
+        muestra = archivo.read(tamano)
+        archivo.seek(posicion)
+        return muestra
+    with open(archivo, 'rb') as f:
+        return f.read(tamano)
+
+def detectar_encoding(archivo, tamano_muestra: int = TAMANO_MUESTRA_ENCODING) -> str:
+    """Detecta el encoding de un CSV a partir de sus primeros bytes."""
+    muestra = _leer_muestra(archivo, tamano_muestra)
+    try:
+        # final=False tolera un carácter multibyte cortado al final de la muestra
+        codecs.getincrementaldecoder('utf-8')().decode(muestra, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        # latin1 decodifica cualquier byte, por lo que no hace falta probar más
+        return 'latin1'
+
+def _leer_csv(archivo, **kwargs) -> pd.DataFrame:
+    """Lee un CSV con un único parseo usando el encoding detectado."""
+    posicion = archivo.tell() if hasattr(archivo, 'read') else None
+    encoding = detectar_encoding(archivo)
+    try:
+        return pd.read_csv(archivo, encoding=encoding, **kwargs)
+    except UnicodeDecodeError:
+        # Bytes no UTF-8 después de la muestra: rebobinar y releer como latin1
+        if posicion is not None:
+            archivo.seek(posicion)
+        return pd.read_csv(archivo, encoding='latin1', **kwargs)
+
+# ====================
+# PROYECCIÓN DE COLUMNAS
+# ====================
+# Los archivos del CRM traen decenas de columnas; solo se leen las del
+# esquema del cliente (config_clientes), con su tipo explícito.
+
+def columnas_origen(cliente_id: str) -> dict:
+    """Obtiene las columnas de origen a leer y su tipo según el esquema del cliente."""
+    return {
+        col_origen: TIPOS_COLUMNAS.get(col_destino, str)
+        for col_destino, col_origen in obtener_esquema_cliente(cliente_id).items()
+    }
+
+def _leer_encabezado(archivo, lector, **kwargs) -> list:
+    """Lee solo la fila de encabezados sin mover la posición del archivo."""
+    posicion = archivo.tell() if hasattr(archivo, 'read') else None
+    try:
+        return list(lector(archivo, nrows=0, **kwargs).columns)
+    finally:
+        if posicion is not None:
+            archivo.seek(posicion)
+
+def validar_columnas(encabezado: list, cliente_id: str):
+    """Verifica que el archivo tenga todas las columnas del esquema del cliente."""
+    faltantes = [col for col in columnas_origen(cliente_id) if col not in encabezado]
+    if faltantes:
+        raise ValueError(f"Faltan columnas requeridas para {cliente_id}: {', '.join(faltantes)}")
+
+def _opciones_lectura(cliente_id: str) -> dict:
+    """Arma usecols y dtype para leer solo las columnas del esquema."""
+    columnas = columnas_origen(cliente_id)
+    if not columnas:
+        # Cliente sin esquema: se lee el archivo completo
+        return {}
+    return {
+        'usecols': list(columnas),
+        'dtype': {col: tipo for col, tipo in columnas.items() if tipo is not None},
+    }
+
+def _encabezado_archivo(archivo, cliente_id: str) -> list:
+    """Lee los encabezados del CSV (PK_CBA) o Excel del cliente."""
+    try:
+        if cliente_id == 'PK_CBA':
+            return _leer_encabezado(archivo, pd.read_csv, encoding=detectar_encoding(archivo))
+        return _leer_encabezado(archivo, pd.read_excel)
+    except Exception as e:
+        raise ValueError(f"Error al cargar el archivo: {str(e)}") from e
+
+# Primeros bytes de un .xlsx (contenedor ZIP); los .xls antiguos no se pueden leer por partes
+FIRMA_XLSX = b'PK\x03\x04'
+
+def _valor_celda(celda):
+    """Convierte una celda de openpyxl igual que pd.read_excel."""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if celda.value is None:
+        return ''
+    if celda.data_type == TYPE_ERROR:
+        return float('nan')
+    if celda.data_type == TYPE_NUMERIC:
+        entero = int(celda.value)
+        return entero if entero == celda.value else float(celda.value)
+    return celda.value
+
+def _filas_xlsx(archivo, columnas=None):
+    """Genera las filas de la primera hoja de un .xlsx sin cargar el libro entero.
+
+    Las filas se recortan al ancho del encabezado (las columnas sin nombre no
+    están en el esquema) y las filas vacías del final se descartan, como en
+    pd.read_excel. Con columnas, solo se convierten y devuelven las celdas de
+    esas columnas del encabezado.
+    """
+    from openpyxl import load_workbook
+
+    libro = load_workbook(archivo, read_only=True, data_only=True, keep_links=False)
+    try:
+        hoja = libro.worksheets[0]
+        hoja.reset_dimensions()
+        ancho = None
+        posiciones = None
+        vacias = 0
+        for celdas in hoja.rows:
+            if posiciones is not None:
+                # Solo las celdas de las columnas pedidas; las demás ni se convierten
+                fila = [_valor_celda(celdas[i]) if i < len(celdas) else '' for i in posiciones]
+            else:
+                fila = [_valor_celda(celda) for celda in celdas]
+            while fila and fila[-1] == '':
+                fila.pop()
+            if ancho is None:
+                if columnas is not None:
+                    buscadas = set(columnas)
+                    posiciones = [i for i, nombre in enumerate(fila) if nombre in buscadas]
+                    fila = [fila[i] for i in posiciones]
+                ancho = len(fila)
+                yield fila
+            elif not fila:
+                # Se emiten solo si después aparece una fila con datos
+                vacias += 1
+            else:
+                for _ in range(vacias):
+                    yield [''] * ancho
+                vacias = 0
+                yield (fila + [''] * (ancho - len(fila)))[:ancho]
+    finally:
+        libro.close()
+
+def _iterar_xlsx(archivo, tamano_bloque: int = None, **opciones):
+    """Lee un .xlsx por bloques con el mismo parser que usa pd.read_excel.
+
+    Las columnas fuera de usecols se descartan fila por fila, antes de
+    convertir sus celdas. Sin tamano_bloque se devuelve un único bloque.
+    """
+    from pandas.io.parsers import TextParser
+
+    filas = _filas_xlsx(archivo, opciones.get('usecols'))
+    encabezado = next(filas, None)
+    if encabezado is None:
+        return
+    while True:
+        bloque = list(islice(filas, tamano_bloque))
+        if not bloque:
+            return
+        yield TextParser([encabezado] + bloque, header=0, skip_blank_lines=False, **opciones).read()
+
+def iterar_archivo(archivo, cliente_id: str, tamano_bloque: int = 100_000):
+    """Lee un archivo por bloques de filas para no cargarlo entero en memoria.
+
+    Los CSV de PK_CBA y los .xlsx se leen en streaming; los .xls no admiten
+    lectura parcial y se devuelven en un único bloque.
+    """
+    # Antes de parsear: un archivo sin las columnas del esquema es un error claro
+    validar_columnas(_encabezado_archivo(archivo, cliente_id), cliente_id)
+    opciones = _opciones_lectura(cliente_id)
+
+    try:
+        if cliente_id == 'PK_CBA':
+            encoding = detectar_encoding(archivo)
+            with pd.read_csv(archivo, encoding=encoding, chunksize=tamano_bloque, **opciones) as lector:
+                yield from lector
+        elif _leer_muestra(archivo, len(FIRMA_XLSX)) == FIRMA_XLSX:
+            yield from _iterar_xlsx(archivo, tamano_bloque, **opciones)
+        else:
+            yield pd.read_excel(archivo, **opciones)
+    except Exception as e:
+        raise ValueError(f"Error al cargar el archivo: {str(e)}") from e
+
 def cargar_archivo(archivo, cliente_id: str) -> pd.DataFrame:
-    """Carga y procesa un archivo según el cliente."""
+    """Carga un archivo leyendo solo las columnas del esquema del cliente."""
+    # Antes de parsear: un archivo sin las columnas del esquema es un error claro
+    validar_columnas(_encabezado_archivo(archivo, cliente_id), cliente_id)
+    opciones = _opciones_lectura(cliente_id)
+
     try:
         if cliente_id == 'PK_CBA':
-            # Intentar diferentes encodings para CSV
-            encodings = ['utf-8', 'latin1', 'iso-8859-1']
-            for encoding in encodings:
-                try:
-                    df = pd.read_csv(archivo, encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
+            # Detectar el encoding una vez y parsear el CSV una sola vez
+            df = _leer_csv(archivo, **opciones)
+        elif _leer_muestra(archivo, len(FIRMA_XLSX)) == FIRMA_XLSX:
+            # Lectura en streaming: las columnas fuera del esquema no se convierten
+            df = next(_iterar_xlsx(archivo, **opciones), None)
+            if df is None:
+                df = pd.read_excel(archivo, **opciones)
         else:
-            # Para archivos Excel
-            df = pd.read_excel(archivo)
+            # Para archivos .xls
+            df = pd.read_excel(archivo, **opciones)
         
         return df
     except Exception as e:
-        st.error(f"Error al cargar el archivo: {str(e)}")
-        return pd.DataFrame()
+        # Sin dependencia de Streamlit: quien llama decide cómo mostrar el error
+        raise ValueError(f"Error al cargar el archivo: {str(e)}") from e
 
-def generar_archivo_descarga(df: pd.DataFrame, columnas_salida: dict, cliente_id: str) -> bytes:
-    """Genera un archivo Excel para descarga sin formato."""
-    output = io.BytesIO()
-    
-    # Crear DataFrame de salida
-    df_salida = pd.DataFrame()
-    
-    # Copiar las columnas al DataFrame de salida
+# ====================
+# ESCRITORES DE SALIDA
+# ====================
+# Formatos disponibles por grupo (clave 'formato_salida' del grupo)
+FORMATOS_SALIDA = {
+    'xlsx': {'extension': 'xlsx', 'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'},
+    'csv': {'extension': 'csv', 'mime': 'text/csv'},
+    'parquet': {'extension': 'parquet', 'mime': 'application/vnd.apache.parquet'},
+}
+
+# Filas que se convierten a objetos de Python por vez al escribir
+TAMANO_BLOQUE_SALIDA = 10_000
+
+def formato_grupo(grupo: dict) -> str:
+    """Obtiene el formato de salida configurado para el grupo (xlsx por defecto)."""
+    formato = grupo.get('formato_salida', 'xlsx')
+    if formato not in FORMATOS_SALIDA:
+        raise ValueError(f"Formato de salida no soportado: {formato}")
+    return formato
+
+def nombre_archivo_salida(cliente_id: str, grupo: dict, fecha_referencia) -> str:
+    """Genera el nombre del archivo de salida de un grupo."""
+    extension = FORMATOS_SALIDA[formato_grupo(grupo)]['extension']
+    return f"{cliente_id}_{grupo['nombre']}_{fecha_referencia.strftime('%d-%m-%Y')}.{extension}"
+
+def _columnas_salida(df: pd.DataFrame, columnas_salida: dict) -> dict:
+    """Resuelve cada columna de salida a su columna de origen (None si no existe)."""
+    columnas = {}
     for col_origen, col_destino in columnas_salida.items():
-        if col_origen in df.columns:
-            df_salida[col_destino] = df[col_origen]
-        else:
-            df_salida[col_destino] = ''
-    
-    # Escribir el archivo sin formato
-    with pd.ExcelWriter(output, engine='openpyxl', mode='w') as writer:
-        df_salida.to_excel(writer, index=False, sheet_name='Sheet1')
-    
-    return output.getvalue() 
\ No newline at end of file
+        # Si dos orígenes van al mismo destino, el último reemplaza al primero
+        columnas[col_destino] = col_origen if col_origen in df.columns else None
+    return columnas
+
+def _filas_salida(df: pd.DataFrame, columnas: dict, tamano_bloque: int = TAMANO_BLOQUE_SALIDA):
+    """Genera las filas de salida por bloques, sin copiar el DataFrame entero."""
+    for inicio in range(0, len(df), tamano_bloque):
+        bloque = df.iloc[inicio:inicio + tamano_bloque]
+        valores = []
+        for col_origen in columnas.values():
+            if col_origen is None:
+                valores.append([''] * len(bloque))
+            else:
+                serie = bloque[col_origen]
+                valores.append(serie.astype(object).where(serie.notna(), None).tolist())
+        yield from zip(*valores)
+
+def _abrir_destino(destino):
+    """Abre el destino en modo binario si es una ruta."""
+    return open(destino, 'wb') if isinstance(destino, (str, os.PathLike)) else nullcontext(destino)
+
+class _EscritorIncremental:
+    """Escritor de salida que recibe los datos por bloques.
+
+    Las columnas de salida se resuelven con el primer bloque; cerrar()
+    completa el archivo y libera el destino.
+    """
+
+    def __init__(self, columnas_salida: dict, destino):
+        self.columnas_salida = columnas_salida
+        self.columnas = None
+        self._pila = ExitStack()
+        self._salida = self._pila.enter_context(_abrir_destino(destino))
+
+    def agregar(self, df: pd.DataFrame):
+        """Agrega las filas del bloque al final del archivo."""
+        if self.columnas is None:
+            self.columnas = _columnas_salida(df, self.columnas_salida)
+            self._abrir()
+        self._agregar(df)
+
+    def cerrar(self):
+        """Termina el archivo (un archivo sin bloques queda solo con el encabezado)."""
+        try:
+            if self.columnas is None:
+                self.columnas = _columnas_salida(pd.DataFrame(), self.columnas_salida)
+                self._abrir()
+            self._cerrar()
+        finally:
+            self._pila.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+class EscritorXlsx(_EscritorIncremental):
+    """XLSX sin formato en modo streaming: openpyxl vuelca las filas a disco."""
+
+    def _abrir(self):
+        self._libro = Workbook(write_only=True)
+        self._hoja = self._libro.create_sheet('Sheet1')
+        self._hoja.append(list(self.columnas))
+
+    def _agregar(self, df: pd.DataFrame):
+        for fila in _filas_salida(df, self.columnas):
+            self._hoja.append(fila)
+
+    def _cerrar(self):
+        self._libro.save(self._salida)
+
+class EscritorCsv(_EscritorIncremental):
+    """CSV en UTF-8 con BOM para que Excel respete los acentos."""
+
+    def _abrir(self):
+        self._texto = io.TextIOWrapper(self._salida, encoding='utf-8-sig', newline='')
+        self._escritor = csv.writer(self._texto)
+        self._escritor.writerow(list(self.columnas))
+
+    def _agregar(self, df: pd.DataFrame):
+        self._escritor.writerows(_filas_salida(df, self.columnas))
+
+    def _cerrar(self):
+        self._texto.flush()
+        self._texto.detach()
+
+class EscritorParquet(_EscritorIncremental):
+    """Parquet columnar con un row group por bloque."""
+
+    def _abrir(self):
+        self._escritor = None
+
+    def _tabla(self, df: pd.DataFrame):
+        import pyarrow as pa
+
+        columnas = {}
+        for col_destino, col_origen in self.columnas.items():
+            if col_origen is None:
+                columnas[col_destino] = pa.array([''] * len(df), type=pa.string())
+                continue
+            arreglo = pa.array(df[col_origen], from_pandas=True)
+            if pa.types.is_dictionary(arreglo.type):
+                # El ancho de los índices depende de las categorías de cada bloque: se fija en int32
+                arreglo = arreglo.cast(pa.dictionary(pa.int32(), arreglo.type.value_type))
+            columnas[col_destino] = arreglo
+        tabla = pa.table(columnas)
+        return tabla if self._escritor is None else tabla.cast(self._escritor.schema)
+
+    def _agregar(self, df: pd.DataFrame):
+        import pyarrow.parquet as pq
+
+        tabla = self._tabla(df)
+        if self._escritor is None:
+            self._escritor = pq.ParquetWriter(self._salida, tabla.schema)
+        self._escritor.write_table(tabla)
+
+    def _cerrar(self):
+        if self._escritor is None:
+            self._agregar(pd.DataFrame())
+        self._escritor.close()
+
+ESCRITORES_INCREMENTALES = {
+    'xlsx': EscritorXlsx,
+    'csv': EscritorCsv,
+    'parquet': EscritorParquet,
+}
+
+def abrir_escritor(formato: str, columnas_salida: dict, destino) -> _EscritorIncremental:
+    """Abre un escritor que recibe las filas de salida por bloques."""
+    if formato not in ESCRITORES_INCREMENTALES:
+        raise ValueError(f"Formato de salida no soportado: {formato}")
+    return ESCRITORES_INCREMENTALES[formato](columnas_salida, destino)
+
+def escribir_xlsx(df: pd.DataFrame, columnas_salida: dict, destino):
+    """Escribe un XLSX sin formato en modo streaming (memoria constante)."""
+    with EscritorXlsx(columnas_salida, destino) as escritor:
+        escritor.agregar(df)
+
+def escribir_csv(df: pd.DataFrame, columnas_salida: dict, destino):
+    """Escribe un CSV en UTF-8 con BOM para que Excel respete los acentos."""
+    with EscritorCsv(columnas_salida, destino) as escritor:
+        escritor.agregar(df)
+
+def escribir_parquet(df: pd.DataFrame, columnas_salida: dict, destino):
+    """Escribe un Parquet columnar con las columnas de salida."""
+    with EscritorParquet(columnas_salida, destino) as escritor:
+        escritor.agregar(df)
+
+ESCRITORES_SALIDA = {
+    'xlsx': escribir_xlsx,
+    'csv': escribir_csv,
+    'parquet': escribir_parquet,
+}
+
+def escribir_salida(df: pd.DataFrame, columnas_salida: dict, destino, formato: str = 'xlsx'):
+    """Escribe las columnas de salida en una ruta o archivo abierto según el formato."""
+    if formato not in ESCRITORES_SALIDA:
+        raise ValueError(f"Formato de salida no soportado: {formato}")
+    ESCRITORES_SALIDA[formato](df, columnas_salida, destino)
+
+def generar_archivo_descarga(df: pd.DataFrame, columnas_salida: dict, cliente_id: str,
+                             formato: str = 'xlsx') -> bytes:
+    """Genera un archivo para descarga sin formato (Excel por defecto)."""
+    output = io.BytesIO()
+    escribir_salida(df, columnas_salida, output, formato)
+    return output.getvalue()
+
+def _empaquetar_zip(trabajos: list, cliente_id: str, max_workers: int = None, usar_procesos: bool = True) -> bytes:
+    """Genera en paralelo los archivos de (ruta_en_zip, grupo, df) y los empaqueta en un ZIP."""
+    output = io.BytesIO()
+    Ejecutor = ProcessPoolExecutor if usar_procesos else ThreadPoolExecutor
+
+    with Ejecutor(max_workers=max_workers) as executor, \
+            zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archivo_zip:
+        futuros = {
+            executor.submit(
+                generar_archivo_descarga, df, grupo['columnas_salida'], cliente_id, formato_grupo(grupo)
+            ): ruta
+            for ruta, grupo, df in trabajos
+        }
+        for futuro in as_completed(futuros):
+            archivo_zip.writestr(futuros[futuro], futuro.result())
+
+    return output.getvalue()
+
+def generar_zip_grupos(segmentos: list, cliente_id: str, fecha_referencia,
+                       max_workers: int = None, usar_procesos: bool = True) -> bytes:
+    """Genera los archivos de todos los grupos en paralelo y los empaqueta en un ZIP.
+
+    segmentos es una lista de tuplas (grupo, df_filtrado). Cada archivo se
+    agrega al ZIP apenas termina, así que el tiempo total queda acotado por el
+    grupo más grande y no por la suma de todos.
+    """
+    trabajos = [
+        (nombre_archivo_salida(cliente_id, grupo, fecha_referencia), grupo, df)
+        for grupo, df in segmentos
+    ]
+    return _empaquetar_zip(trabajos, cliente_id, max_workers, usar_procesos)
+
+def generar_zip_rango(segmentos_por_fecha: list, cliente_id: str,
+                      max_workers: int = None, usar_procesos: bool = True) -> bytes:
+    """Empaqueta los grupos de varias fechas de referencia en un ZIP con una carpeta por fecha.
+
+    segmentos_por_fecha es una lista de tuplas (fecha, [(grupo, df_filtrado), ...]).
+    """
+    trabajos = [
+        (f"{fecha:%Y-%m-%d}/{nombre_archivo_salida(cliente_id, grupo, fecha)}", grupo, df)
+        for fecha, segmentos in segmentos_por_fecha
+        for grupo, df in segmentos
+    ]
+    return _empaquetar_zip(trabajos, cliente_id, max_workers, usar_procesos)
@@ -0,0 +1,250 @@
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+def columna_resolucion(cliente_id: str) -> str:
+    """Obtiene la columna de resolución usada para filtrar según el cliente."""
+    return 'Ultima Resolución' if cliente_id in ['ULINEA', 'ANAHUAC'] else 'Resolución'
+
+# ====================
+# RESOLUCIONES CANÓNICAS
+# ====================
+# Las resoluciones se comparan sin mayúsculas, acentos ni espacios repetidos
+# ('buzón de voz' == 'Buzon  de Voz'). La forma canónica se calcula solo sobre
+# los valores distintos de la columna y se recuerda por cliente.
+
+# Valores distintos recordados por cliente antes de vaciar su mapa
+MAX_VALORES_CANONICOS = 100_000
+
+_mapas_canonicos = {}
+
+@lru_cache(maxsize=4096)
+def canonizar_texto(valor: str) -> str:
+    """Forma canónica de un texto: sin acentos, en minúsculas y con espacios simples."""
+    sin_acentos = ''.join(
+        caracter for caracter in unicodedata.normalize('NFKD', str(valor))
+        if not unicodedata.combining(caracter)
+    )
+    return ' '.join(sin_acentos.casefold().split())
+
+def resoluciones_canonicas(resoluciones) -> pd.Index:
+    """Obtiene las formas canónicas distintas de una lista de resoluciones."""
+    return pd.Index([canonizar_texto(resolucion) for resolucion in resoluciones], dtype=object).unique()
+
+def mapa_canonico(valores: pd.Index, cliente_id: str = None) -> np.ndarray:
+    """Obtiene la forma canónica de cada valor, calculando solo los que el cliente no tenía."""
+    mapa = _mapas_canonicos.setdefault(cliente_id, {})
+    if len(mapa) > MAX_VALORES_CANONICOS:
+        mapa.clear()
+    for valor in valores:
+        if valor not in mapa:
+            mapa[valor] = canonizar_texto(valor)
+    return np.array([mapa[valor] for valor in valores], dtype=object)
+
+def _codigos_canonicos(codigos: np.ndarray, valores: pd.Index, cliente_id: str = None):
+    """Reagrupa los códigos de resolución por forma canónica (el nulo, -1, se conserva)."""
+    codigos_valor, canonicas = pd.factorize(mapa_canonico(valores, cliente_id))
+    if len(codigos_valor) == 0:
+        return codigos, pd.Index(canonicas, dtype=object)
+    return np.where(codigos >= 0, codigos_valor[codigos], -1), pd.Index(canonicas, dtype=object)
+
+def preparar_indices(df: pd.DataFrame, col_resolucion: str, cliente_id: str = None) -> dict:
+    """Precalcula la clave de fecha y el índice de resoluciones una sola vez."""
+    indices = {'n_filas': len(df), 'fecha': None, 'resolucion_codigos': None, 'resoluciones': None}
+
+    # Clave de fecha normalizada al día (NaT nunca coincide con una fecha)
+    if 'Fecha_Lead' in df.columns:
+        indices['fecha'] = pd.to_datetime(df['Fecha_Lead']).to_numpy(dtype='datetime64[D]')
+
+    # Códigos enteros por resolución canónica distinta (a partir de los de la categoría, si ya lo es)
+    if col_resolucion in df.columns:
+        serie = df[col_resolucion]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos, valores = serie.cat.codes.to_numpy(), serie.cat.categories
+        else:
+            codigos, valores = pd.factorize(serie)
+        indices['resolucion_codigos'], indices['resoluciones'] = _codigos_canonicos(codigos, pd.Index(valores), cliente_id)
+
+    return indices
+
+def resoluciones_grupo(grupo: dict, fecha_referencia) -> list:
+    """Obtiene las resoluciones que aplican al grupo en la fecha de referencia."""
+    resoluciones = grupo.get('resoluciones')
+    if isinstance(resoluciones, dict):
+        # Para UNAB Nurturing
+        dia_actual = fecha_referencia.strftime('%A')
+        return resoluciones.get(dia_actual, [])
+    return resoluciones
+
+def fechas_grupo(grupo: dict, fecha_referencia) -> list:
+    """Obtiene los días que abarca el filtro de fecha del grupo."""
+    dias_antes = grupo['dias_antes']
+    if not isinstance(dias_antes, list):
+        dias_antes = [dias_antes]
+    return [fecha_referencia - pd.Timedelta(days=dias) for dias in dias_antes]
+
+def seleccionar_grupo(df: pd.DataFrame, mascara: np.ndarray) -> pd.DataFrame:
+    """Materializa las filas seleccionadas por la máscara de un grupo."""
+    return df[mascara]
+
+# ====================
+# MOTOR DE REGLAS
+# ====================
+# Los grupos de un cliente se compilan una vez en reglas (fechas y resoluciones
+# válidas) y se evalúan juntos: cada regla ocupa un bit de un entero de 64 bits,
+# se arma una tabla de bits por resolución y otra por día, y la pertenencia de
+# cada lead sale de dos búsquedas y un AND sobre todas las filas.
+
+ASIGNACIONES = ('superpuesta', 'exclusiva')
+MAX_REGLAS = 64
+
+def _orden_prioridad(grupo: dict):
+    """Menor 'prioridad' primero; los grupos sin prioridad van al final en su orden."""
+    prioridad = grupo.get('prioridad')
+    return (prioridad is None, prioridad or 0)
+
+def compilar_reglas(grupos: list, fecha_referencia, asignacion: str = 'superpuesta') -> dict:
+    """Compila los grupos en reglas listas para evaluarse en una sola pasada.
+
+    Con asignación 'superpuesta' un lead puede quedar en varios grupos; con
+    'exclusiva' queda solo en el de mayor prioridad que cumpla.
+    """
+    if asignacion not in ASIGNACIONES:
+        raise ValueError(f"Asignación no soportada: {asignacion}. Opciones: {', '.join(ASIGNACIONES)}")
+    if len(grupos) > MAX_REGLAS:
+        raise ValueError(f"No se pueden compilar más de {MAX_REGLAS} grupos")
+
+    reglas = []
+    for orden in sorted(range(len(grupos)), key=lambda i: _orden_prioridad(grupos[i])):
+        grupo = grupos[orden]
+        resoluciones = resoluciones_grupo(grupo, fecha_referencia)
+        reglas.append({
+            'grupo': grupo,
+            'orden': orden,
+            'fechas': (np.array(fechas_grupo(grupo, fecha_referencia), dtype='datetime64[D]')
+                       if grupo.get('filtro_fecha') else None),
+            'resoluciones': (resoluciones_canonicas(resoluciones)
+                             if grupo.get('filtro_resolucion') and resoluciones is not None else None),
+        })
+    return {'asignacion': asignacion, 'reglas': reglas}
+
+def _bit(posicion: int) -> np.uint64:
+    return np.uint64(1) << np.uint64(posicion)
+
+def _tabla_resoluciones(indices: dict, reglas: list):
+    """Bits de las reglas que admite cada código de resolución (el último lugar es el nulo, -1)."""
+    codigos = indices['resolucion_codigos']
+    if codigos is None:
+        codigos = np.full(indices['n_filas'], -1, dtype=np.int64)
+    tabla = np.zeros((0 if indices['resoluciones'] is None else len(indices['resoluciones'])) + 1, dtype=np.uint64)
+
+    for posicion, regla in enumerate(reglas):
+        # Sin índice de resoluciones el filtro no aplica
+        if regla['resoluciones'] is None or indices['resolucion_codigos'] is None:
+            tabla |= _bit(posicion)
+        else:
+            validos = indices['resoluciones'].get_indexer(regla['resoluciones'])
+            tabla[validos[validos >= 0]] |= _bit(posicion)
+    return tabla, codigos
+
+def _tabla_fechas(indices: dict, reglas: list):
+    """Bits de las reglas que admite cada día, indexados por desplazamiento desde el primero."""
+    fecha = indices['fecha']
+    if fecha is None:
+        fecha = np.full(indices['n_filas'], np.datetime64('NaT'), dtype='datetime64[D]')
+    nulas = np.isnat(fecha)
+    dias = fecha.view('int64')
+    primero = dias[~nulas].min() if (~nulas).any() else 0
+    # Las fechas nulas van al último lugar de la tabla (-1), que ninguna regla con fecha admite
+    codigos = np.where(nulas, -1, dias - primero)
+    tabla = np.zeros((int(codigos.max()) + 2) if len(codigos) else 1, dtype=np.uint64)
+
+    for posicion, regla in enumerate(reglas):
+        if regla['fechas'] is None:
+            tabla |= _bit(posicion)
+        else:
+            desplazamientos = regla['fechas'].view('int64') - primero
+            desplazamientos = desplazamientos[(desplazamientos >= 0) & (desplazamientos < len(tabla) - 1)]
+            tabla[desplazamientos] |= _bit(posicion)
+    return tabla, codigos
+
+def asignar_grupos(indices: dict, compiladas: dict) -> np.ndarray:
+    """Evalúa todas las reglas en una sola pasada y devuelve la pertenencia de cada lead.
+
+    El bit i de cada valor indica que el lead cumple la regla i; en asignación
+    exclusiva solo queda encendido el de la regla de mayor prioridad.
+    """
+    tabla_resoluciones, codigos_resolucion = _tabla_resoluciones(indices, compiladas['reglas'])
+    tabla_fechas, codigos_fecha = _tabla_fechas(indices, compiladas['reglas'])
+    pertenencia = tabla_resoluciones[codigos_resolucion] & tabla_fechas[codigos_fecha]
+
+    if compiladas['asignacion'] == 'exclusiva':
+        # x & -x conserva el bit más bajo, que es la regla de mayor prioridad
+        pertenencia &= np.uint64(0) - pertenencia
+    return pertenencia
+
+def mascaras_reglas(pertenencia: np.ndarray, compiladas: dict) -> list:
+    """Obtiene la máscara booleana de cada grupo, en el orden en que se pasaron los grupos."""
+    mascaras = [None] * len(compiladas['reglas'])
+    for posicion, regla in enumerate(compiladas['reglas']):
+        mascaras[regla['orden']] = (pertenencia & _bit(posicion)) != 0
+    return mascaras
+
+# ====================
+# BACKFILL POR RANGO DE FECHAS
+# ====================
+
+def _dias_reglas(compiladas: dict):
+    """Días que necesitan las reglas (None si alguna no filtra por fecha)."""
+    dias = []
+    for regla in compiladas['reglas']:
+        if regla['fechas'] is None:
+            return None
+        dias.append(regla['fechas'])
+    return np.unique(np.concatenate(dias)) if dias else np.array([], dtype='datetime64[D]')
+
+def _subindices(indices: dict, posiciones: np.ndarray) -> dict:
+    """Restringe los índices precalculados a las filas indicadas."""
+    return {
+        'n_filas': len(posiciones),
+        'fecha': None if indices['fecha'] is None else indices['fecha'][posiciones],
+        'resolucion_codigos': None if indices['resolucion_codigos'] is None else indices['resolucion_codigos'][posiciones],
+        'resoluciones': indices['resoluciones'],
+    }
+
+def segmentar_rango(df: pd.DataFrame, grupos: list, fecha_desde, fecha_hasta, col_resolucion: str,
+                    asignacion: str = 'superpuesta', cliente_id: str = None):
+    """Segmenta los grupos para cada fecha de referencia del rango a partir de una sola carga.
+
+    Las filas se agrupan una vez por día del lead; para cada fecha solo se
+    evalúan los días que piden sus reglas, así el costo crece con los datos y
+    no con días × datos (salvo grupos sin filtro de fecha, que miran todo).
+    Genera tuplas (fecha, [(grupo, df_grupo), ...]) en orden de fecha.
+    """
+    fechas = pd.date_range(pd.Timestamp(fecha_desde).normalize(), pd.Timestamp(fecha_hasta).normalize(), freq='D')
+    if fechas.empty:
+        raise ValueError("La fecha final del rango es anterior a la inicial")
+
+    indices = preparar_indices(df, col_resolucion, cliente_id)
+    # Posiciones de las filas de cada día (clave: días desde 1970)
+    filas_por_dia = {}
+    if indices['fecha'] is not None:
+        filas_por_dia = pd.Series(indices['fecha'].view('int64')).groupby(
+            indices['fecha'].view('int64'), sort=False
+        ).indices
+    sin_filas = np.array([], dtype=np.intp)
+
+    for fecha in fechas:
+        compiladas = compilar_reglas(grupos, fecha, asignacion)
+        dias = _dias_reglas(compiladas)
+        if dias is None:
+            posiciones = np.arange(indices['n_filas'])
+        else:
+            posiciones = np.sort(np.concatenate(
+                [filas_por_dia.get(dia, sin_filas) for dia in dias.view('int64').tolist()] or [sin_filas]
+            ))
+
+        mascaras = mascaras_reglas(asignar_grupos(_subindices(indices, posiciones), compiladas), compiladas)
+        yield fecha, [(grupo, df.iloc[posiciones[mascara]]) for grupo, mascara in zip(grupos, mascaras)]
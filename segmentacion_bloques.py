@@ -0,0 +1,91 @@
+import os
+from contextlib import ExitStack
+
+import numpy as np
+
+from procesamiento import (
+    procesar_cliente_especifico, iterar_archivo, abrir_escritor, formato_grupo, nombre_archivo_salida,
+    programas_sin_codigo, separar_fechas_invalidas
+)
+from segmentacion import (
+    columna_resolucion, preparar_indices, compilar_reglas, asignar_grupos, mascaras_reglas, seleccionar_grupo
+)
+from supresion import filtrar_contactados, claves_exportadas, registrar_claves
+
+# Filas por bloque del modo fuera de memoria
+TAMANO_BLOQUE = 100_000
+
+def iterar_bloques(archivos: list, cliente_id: str, tamano_bloque: int = TAMANO_BLOQUE):
+    """Genera los leads de los archivos ya limpios y con fecha, de a un bloque por vez.
+
+    Cada elemento es (bloque, omitidos): los registros con fecha no
+    reconocida se descartan y solo se informa cuántos eran.
+    """
+    for archivo in archivos:
+        for bloque in iterar_archivo(archivo, cliente_id, tamano_bloque):
+            bloque, invalidos = separar_fechas_invalidas(procesar_cliente_especifico(bloque, cliente_id))
+            yield bloque, len(invalidos)
+
+def segmentar_en_bloques(archivos: list, cliente_id: str, grupos: list, fecha_referencia,
+                         directorio_salida: str, asignacion: str = 'superpuesta',
+                         tamano_bloque: int = TAMANO_BLOQUE) -> dict:
+    """Segmenta y exporta los grupos sin cargar todos los leads a la vez.
+
+    Cada bloque pasa por carga, limpieza, fechas y reglas, y sus filas se
+    agregan directo al archivo de cada grupo: la memoria queda acotada por el
+    tamaño del bloque. Las reglas y la supresión evalúan cada lead por
+    separado, así que el resultado es el mismo que segmentando todo junto.
+    Los archivos se escriben con un nombre temporal y se renombran al
+    terminar; un grupo sin leads no genera archivo. Los contactos se
+    registran para la supresión recién cuando todos los archivos quedaron
+    en su lugar: si algo falla, nadie queda suprimido sin haber sido exportado.
+    Devuelve la cantidad de leads leídos y exportados por grupo, los
+    omitidos por fecha no reconocida y los leads de cada programa sin código.
+    """
+    reglas = compilar_reglas(grupos, fecha_referencia, asignacion)
+    col_resolucion = columna_resolucion(cliente_id)
+    resumen = {'leads': 0, 'bloques': 0, 'fechas_invalidas': 0, 'grupos': {grupo['nombre']: 0 for grupo in grupos},
+               'programas_sin_codigo': {}}
+    escritores = {}
+    temporales = {}
+    # Grupo -> claves de contacto exportadas de cada bloque
+    claves = {}
+
+    try:
+        with ExitStack() as pila:
+            for bloque, omitidos in iterar_bloques(archivos, cliente_id, tamano_bloque):
+                resumen['leads'] += len(bloque)
+                resumen['fechas_invalidas'] += omitidos
+                resumen['bloques'] += 1
+                for programa, n in programas_sin_codigo(bloque, cliente_id).items():
+                    resumen['programas_sin_codigo'][programa] = resumen['programas_sin_codigo'].get(programa, 0) + int(n)
+                mascaras = mascaras_reglas(asignar_grupos(preparar_indices(bloque, col_resolucion, cliente_id), reglas), reglas)
+
+                for i, (grupo, mascara) in enumerate(zip(grupos, mascaras)):
+                    df_grupo, _ = filtrar_contactados(
+                        seleccionar_grupo(bloque, mascara), cliente_id, grupo, fecha_referencia
+                    )
+                    if df_grupo.empty:
+                        continue
+                    if i not in escritores:
+                        os.makedirs(directorio_salida, exist_ok=True)
+                        ruta = os.path.join(directorio_salida, nombre_archivo_salida(cliente_id, grupo, fecha_referencia))
+                        temporales[i] = (f"{ruta}.{os.getpid()}.{i}.tmp", ruta)
+                        escritores[i] = pila.enter_context(
+                            abrir_escritor(formato_grupo(grupo), grupo['columnas_salida'], temporales[i][0])
+                        )
+                    escritores[i].agregar(df_grupo)
+                    # Las exportaciones del mismo día no suprimen: registrar al final no cambia el resultado
+                    claves.setdefault(i, []).append(claves_exportadas(df_grupo, grupo))
+                    resumen['grupos'][grupo['nombre']] += len(df_grupo)
+    except BaseException:
+        for temporal, _ in temporales.values():
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        raise
+
+    for temporal, ruta in temporales.values():
+        os.replace(temporal, ruta)
+    for i, claves_grupo in claves.items():
+        registrar_claves(np.unique(np.concatenate(claves_grupo)), cliente_id, grupos[i], fecha_referencia)
+    return resumen
@@ -0,0 +1,466 @@
+"""Servicio HTTP local para pedir segmentaciones sin pasar por la app.
+
+Los trabajos se encolan en un pool acotado de procesos; las peticiones
+responden enseguida y el estado y los archivos se consultan después.
+
+Ejemplo:
+    python servicio_segmentacion.py --puerto 8502 --workers 4
+
+    curl -F cliente=CREXE -F fecha=2024-03-04 -F archivo=@leads.xlsx http://127.0.0.1:8502/trabajos
+    curl http://127.0.0.1:8502/trabajos/<id>
+    curl -O http://127.0.0.1:8502/trabajos/<id>/archivos/<nombre>
+
+Endpoints:
+    GET  /salud                              estado del servicio y de la cola
+    GET  /clientes                           clientes y grupos configurados
+    POST /trabajos                           nuevo trabajo (multipart o JSON)
+    GET  /trabajos                           trabajos conocidos
+    GET  /trabajos/<id>                      estado, resumen y archivos generados
+    GET  /trabajos/<id>/archivos/<nombre>    descarga de un archivo generado
+
+En JSON el cuerpo es {"cliente", "fecha", "hasta"?, "rutas"?, "archivos"?}, con
+"archivos" como lista de {"nombre", "contenido_base64"}; un campo con otro tipo
+o no admitido se responde con 400. Las rutas solo se
+aceptan dentro del directorio indicado con --rutas-permitidas.
+"""
+import argparse
+import base64
+import email.parser
+import email.policy
+import json
+import mimetypes
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlparse
+
+from batch_segmentacion import extensiones_cliente, segmentar_cliente
+from config_clientes import CLIENTES
+
+# Directorio de trabajo: archivos subidos y resultados de cada trabajo
+DIRECTORIO_TRABAJOS = os.environ.get(
+    'SEGMENTACION_TRABAJOS_DIR',
+    os.path.join(tempfile.gettempdir(), 'segmentacion_leads_trabajos')
+)
+
+# Trabajos en cola o en proceso admitidos antes de rechazar nuevos (503)
+MAX_COLA = 32
+# Trabajos terminados que se conservan; los más antiguos se borran con sus archivos
+MAX_TRABAJOS_GUARDADOS = 200
+# Tamaño máximo del cuerpo de una petición
+MAX_BYTES_PETICION = 512 * 1024 ** 2
+
+class ErrorPeticion(ValueError):
+    """Petición inválida: se responde con el código HTTP indicado."""
+
+    def __init__(self, mensaje: str, estado: HTTPStatus = HTTPStatus.BAD_REQUEST):
+        super().__init__(mensaje)
+        self.estado = estado
+
+# ====================
+# COLA DE TRABAJOS
+# ====================
+
+class ColaTrabajos:
+    """Registro de trabajos y pool acotado de procesos que los ejecuta."""
+
+    def __init__(self, max_workers: int = None, max_cola: int = MAX_COLA, directorio: str = None,
+                 directorio_almacen: str = None, max_guardados: int = MAX_TRABAJOS_GUARDADOS):
+        self.directorio = directorio or DIRECTORIO_TRABAJOS
+        self.directorio_almacen = directorio_almacen
+        self.max_cola = max_cola
+        self.max_guardados = max_guardados
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._trabajos = OrderedDict()
+        self._futuros = {}
+        self._candado = threading.Lock()
+
+    def _activos(self) -> int:
+        return sum(1 for trabajo in self._trabajos.values() if trabajo['estado'] in ('en_cola', 'procesando'))
+
+    def directorio_trabajo(self, id_trabajo: str) -> str:
+        return os.path.join(self.directorio, id_trabajo)
+
+    def crear(self, cliente_id: str, fecha_referencia, fecha_hasta=None) -> dict:
+        """Reserva un lugar en la cola y el directorio del trabajo."""
+        with self._candado:
+            if self._activos() >= self.max_cola:
+                raise ErrorPeticion("Cola llena, reintentar más tarde", HTTPStatus.SERVICE_UNAVAILABLE)
+            trabajo = {
+                'id': uuid.uuid4().hex,
+                'cliente': cliente_id,
+                'fecha': fecha_referencia.isoformat(),
+                'hasta': fecha_hasta.isoformat() if fecha_hasta else None,
+                'estado': 'en_cola',
+                'creado': datetime.now().isoformat(timespec='seconds'),
+                'terminado': None,
+                'resumen': None,
+                'error': None,
+            }
+            self._trabajos[trabajo['id']] = trabajo
+        os.makedirs(os.path.join(self.directorio_trabajo(trabajo['id']), 'entrada'), exist_ok=True)
+        return trabajo
+
+    def encolar(self, trabajo: dict, archivos: list):
+        """Envía el trabajo al pool; la petición no espera a que termine."""
+        directorio = self.directorio_trabajo(trabajo['id'])
+        fecha_hasta = datetime.strptime(trabajo['hasta'], '%Y-%m-%d').date() if trabajo['hasta'] else None
+        futuro = self._executor.submit(
+            segmentar_cliente,
+            trabajo['cliente'],
+            os.path.join(directorio, 'entrada'),
+            datetime.strptime(trabajo['fecha'], '%Y-%m-%d').date(),
+            os.path.join(directorio, 'salida'),
+            self.directorio_almacen,
+            fecha_hasta,
+            archivos,
+        )
+        with self._candado:
+            self._futuros[trabajo['id']] = futuro
+        futuro.add_done_callback(lambda f: self._terminar(trabajo['id'], f))
+
+    def _terminar(self, id_trabajo: str, futuro):
+        """Registra el resultado de un trabajo (se ejecuta al terminar en el pool)."""
+        try:
+            resumen = futuro.result()
+            error = resumen.get('error')
+        except Exception as e:
+            resumen, error = None, str(e)
+        self.finalizar(id_trabajo, resumen, error)
+
+    def finalizar(self, id_trabajo: str, resumen: dict = None, error: str = None):
+        """Marca un trabajo como terminado o con error y descarta los más antiguos."""
+        with self._candado:
+            self._futuros.pop(id_trabajo, None)
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is None:
+                return
+            trabajo['resumen'] = resumen
+            trabajo['error'] = error
+            trabajo['estado'] = 'error' if error else 'terminado'
+            trabajo['terminado'] = datetime.now().isoformat(timespec='seconds')
+            descartados = self._descartar_antiguos()
+        for id_descartado in descartados:
+            shutil.rmtree(self.directorio_trabajo(id_descartado), ignore_errors=True)
+
+    def _descartar_antiguos(self) -> list:
+        """Quita del registro los trabajos terminados más antiguos por encima del límite."""
+        terminados = [id_trabajo for id_trabajo, trabajo in self._trabajos.items()
+                      if trabajo['estado'] in ('terminado', 'error')]
+        descartados = terminados[:max(len(terminados) - self.max_guardados, 0)]
+        for id_trabajo in descartados:
+            del self._trabajos[id_trabajo]
+        return descartados
+
+    def archivos(self, id_trabajo: str) -> list:
+        """Lista los archivos generados por el trabajo (rutas relativas a su salida)."""
+        salida = os.path.join(self.directorio_trabajo(id_trabajo), 'salida')
+        return sorted(
+            os.path.relpath(os.path.join(raiz, nombre), salida).replace(os.sep, '/')
+            for raiz, _, nombres in os.walk(salida)
+            for nombre in nombres
+        )
+
+    def ruta_archivo(self, id_trabajo: str, nombre: str) -> str:
+        """Obtiene la ruta de un archivo generado, sin salir del directorio del trabajo."""
+        salida = os.path.realpath(os.path.join(self.directorio_trabajo(id_trabajo), 'salida'))
+        ruta = os.path.realpath(os.path.join(salida, nombre))
+        if os.path.commonpath([salida, ruta]) != salida or not os.path.isfile(ruta):
+            raise ErrorPeticion(f"Archivo no encontrado: {nombre}", HTTPStatus.NOT_FOUND)
+        return ruta
+
+    def estado(self, id_trabajo: str) -> dict:
+        with self._candado:
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is None:
+                raise ErrorPeticion(f"Trabajo no encontrado: {id_trabajo}", HTTPStatus.NOT_FOUND)
+            trabajo = dict(trabajo)
+            futuro = self._futuros.get(id_trabajo)
+        if trabajo['estado'] == 'en_cola' and futuro is not None and futuro.running():
+            trabajo['estado'] = 'procesando'
+        if trabajo['estado'] == 'terminado':
+            trabajo['archivos'] = [
+                {'nombre': nombre, 'url': f"/trabajos/{id_trabajo}/archivos/{quote(nombre)}"}
+                for nombre in self.archivos(id_trabajo)
+            ]
+        return trabajo
+
+    def listar(self) -> list:
+        with self._candado:
+            ids = list(self._trabajos)
+        trabajos = []
+        for id_trabajo in ids:
+            try:
+                trabajo = self.estado(id_trabajo)
+            except ErrorPeticion:
+                # Descartado mientras se armaba la lista
+                continue
+            trabajos.append({clave: trabajo[clave] for clave in ('id', 'cliente', 'fecha', 'hasta', 'estado', 'creado')})
+        return trabajos
+
+    def salud(self) -> dict:
+        with self._candado:
+            return {'activos': self._activos(), 'max_cola': self.max_cola, 'trabajos': len(self._trabajos)}
+
+    def cerrar(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+# ====================
+# LECTURA DE PETICIONES
+# ====================
+
+def _fecha(valor: str, campo: str):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ErrorPeticion(f"'{campo}' debe tener el formato AAAA-MM-DD")
+
+def leer_multipart(tipo_contenido: str, cuerpo: bytes):
+    """Separa un multipart/form-data en campos de texto y archivos (nombre, bytes)."""
+    mensaje = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {tipo_contenido}\r\n\r\n".encode('latin1') + cuerpo
+    )
+    if not mensaje.is_multipart():
+        raise ErrorPeticion("Cuerpo multipart inválido")
+    campos, archivos = {}, []
+    for parte in mensaje.iter_parts():
+        nombre_campo = parte.get_param('name', header='content-disposition')
+        nombre_archivo = parte.get_filename()
+        if nombre_archivo:
+            archivos.append((nombre_archivo, parte.get_payload(decode=True) or b''))
+        elif nombre_campo:
+            campos.setdefault(nombre_campo, []).append(parte.get_content().strip())
+    return campos, archivos
+
+# Campos admitidos en un cuerpo JSON; los grupos siempre salen de config_clientes
+CAMPOS_JSON = ('cliente', 'fecha', 'hasta', 'rutas', 'archivos')
+
+def _texto(datos: dict, campo: str):
+    valor = datos.get(campo)
+    if valor is not None and not isinstance(valor, str):
+        raise ErrorPeticion(f"'{campo}' debe ser un texto")
+    return valor
+
+def _lista(datos: dict, campo: str) -> list:
+    valor = datos.get(campo)
+    if valor is None:
+        return []
+    if not isinstance(valor, list):
+        raise ErrorPeticion(f"'{campo}' debe ser una lista")
+    return valor
+
+def leer_json(cuerpo: bytes):
+    """Obtiene campos y archivos de un cuerpo JSON con archivos en base64."""
+    try:
+        datos = json.loads(cuerpo or b'{}')
+    except ValueError:
+        raise ErrorPeticion("JSON inválido")
+    if not isinstance(datos, dict):
+        raise ErrorPeticion("Se esperaba un objeto JSON")
+    desconocidos = [campo for campo in datos if campo not in CAMPOS_JSON]
+    if desconocidos:
+        raise ErrorPeticion(f"Campos no admitidos: {', '.join(map(str, desconocidos))} "
+                            f"(se aceptan {', '.join(CAMPOS_JSON)}; los grupos son los del cliente)")
+
+    campos = {campo: [_texto(datos, campo)] for campo in ('cliente', 'fecha', 'hasta') if _texto(datos, campo)}
+    campos['rutas'] = _lista(datos, 'rutas')
+    if not all(isinstance(ruta, str) for ruta in campos['rutas']):
+        raise ErrorPeticion("'rutas' debe ser una lista de textos")
+    archivos = []
+    for archivo in _lista(datos, 'archivos'):
+        if not (isinstance(archivo, dict) and isinstance(archivo.get('nombre'), str)
+                and isinstance(archivo.get('contenido_base64'), str)):
+            raise ErrorPeticion("Cada elemento de 'archivos' debe ser un objeto con 'nombre' y 'contenido_base64' (textos)")
+        try:
+            archivos.append((archivo['nombre'], base64.b64decode(archivo['contenido_base64'], validate=True)))
+        except ValueError:
+            raise ErrorPeticion(f"'contenido_base64' inválido en el archivo {archivo['nombre']}")
+    return campos, archivos
+
+def resolver_rutas(rutas: list, cliente_id: str, rutas_permitidas: str = None) -> list:
+    """Valida las rutas pedidas: deben existir y estar dentro del directorio permitido."""
+    if rutas and not rutas_permitidas:
+        raise ErrorPeticion("El servicio no acepta rutas; iniciar con --rutas-permitidas o subir los archivos")
+    base = os.path.realpath(rutas_permitidas) if rutas_permitidas else None
+    resueltas = []
+    for ruta in rutas:
+        real = os.path.realpath(ruta)
+        if os.path.commonpath([base, real]) != base:
+            raise ErrorPeticion(f"Ruta fuera del directorio permitido: {ruta}", HTTPStatus.FORBIDDEN)
+        if not os.path.isfile(real):
+            raise ErrorPeticion(f"No existe el archivo: {ruta}")
+        if not real.lower().endswith(extensiones_cliente(cliente_id)):
+            raise ErrorPeticion(f"Extensión no admitida para {cliente_id}: {ruta}")
+        resueltas.append(real)
+    return resueltas
+
+def guardar_subidos(archivos: list, directorio: str, cliente_id: str) -> list:
+    """Escribe los archivos subidos en la entrada del trabajo y devuelve sus rutas."""
+    rutas = []
+    for i, (nombre, contenido) in enumerate(archivos):
+        nombre = os.path.basename(nombre.replace('\\', '/')) or f"archivo_{i}"
+        if not nombre.lower().endswith(extensiones_cliente(cliente_id)):
+            raise ErrorPeticion(f"Extensión no admitida para {cliente_id}: {nombre}")
+        # Prefijo con el orden de subida: evita pisar archivos con el mismo nombre
+        ruta = os.path.join(directorio, f"{i:03d}_{nombre}")
+        with open(ruta, 'wb') as f:
+            f.write(contenido)
+        rutas.append(ruta)
+    return rutas
+
+# ====================
+# SERVIDOR HTTP
+# ====================
+
+class ManejadorSegmentacion(BaseHTTPRequestHandler):
+    """Atiende las peticiones; cada una corre en su propio hilo y nunca espera a un trabajo."""
+
+    server_version = 'SegmentacionLeads/1.0'
+
+    @property
+    def cola(self) -> ColaTrabajos:
+        return self.server.cola
+
+    def log_message(self, formato, *args):
+        if not self.server.silencioso:
+            super().log_message(formato, *args)
+
+    def _responder_json(self, datos, estado: HTTPStatus = HTTPStatus.OK):
+        cuerpo = json.dumps(datos, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _responder_archivo(self, ruta: str):
+        tipo = mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(os.path.getsize(ruta)))
+        self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(os.path.basename(ruta))}")
+        self.end_headers()
+        with open(ruta, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def _atender(self, metodo):
+        try:
+            metodo()
+        except ErrorPeticion as e:
+            self._responder_json({'error': str(e)}, e.estado)
+        except Exception as e:
+            self._responder_json({'error': f"Error interno: {e}"}, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    def _partes_ruta(self) -> list:
+        return [unquote(parte) for parte in urlparse(self.path).path.split('/') if parte]
+
+    def do_GET(self):
+        self._atender(self._get)
+
+    def do_POST(self):
+        self._atender(self._post)
+
+    def _get(self):
+        partes = self._partes_ruta()
+        if partes == ['salud']:
+            self._responder_json({'estado': 'ok', **self.cola.salud()})
+        elif partes == ['clientes']:
+            self._responder_json({
+                cliente_id: [grupo['nombre'] for grupo in config['grupos']]
+                for cliente_id, config in CLIENTES.items()
+            })
+        elif partes == ['trabajos']:
+            self._responder_json(self.cola.listar())
+        elif len(partes) == 2 and partes[0] == 'trabajos':
+            self._responder_json(self.cola.estado(partes[1]))
+        elif len(partes) >= 4 and partes[0] == 'trabajos' and partes[2] == 'archivos':
+            self.cola.estado(partes[1])
+            self._responder_archivo(self.cola.ruta_archivo(partes[1], '/'.join(partes[3:])))
+        else:
+            raise ErrorPeticion(f"Ruta no encontrada: {self.path}", HTTPStatus.NOT_FOUND)
+
+    def _leer_cuerpo(self) -> bytes:
+        longitud = int(self.headers.get('Content-Length') or 0)
+        if longitud > MAX_BYTES_PETICION:
+            raise ErrorPeticion("Petición demasiado grande", HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        return self.rfile.read(longitud)
+
+    def _post(self):
+        if self._partes_ruta() != ['trabajos']:
+            raise ErrorPeticion(f"Ruta no encontrada: {self.path}", HTTPStatus.NOT_FOUND)
+
+        tipo_contenido = self.headers.get('Content-Type', '')
+        cuerpo = self._leer_cuerpo()
+        if tipo_contenido.startswith('multipart/form-data'):
+            campos, archivos = leer_multipart(tipo_contenido, cuerpo)
+        else:
+            campos, archivos = leer_json(cuerpo)
+
+        cliente_id = (campos.get('cliente') or [None])[0]
+        if cliente_id not in CLIENTES:
+            raise ErrorPeticion(f"Cliente inválido: {cliente_id}. Opciones: {', '.join(CLIENTES)}")
+        fecha_referencia = _fecha((campos.get('fecha') or [datetime.now().strftime('%Y-%m-%d')])[0], 'fecha')
+        fecha_hasta = _fecha(campos['hasta'][0], 'hasta') if campos.get('hasta') else None
+        if fecha_hasta is not None and fecha_hasta < fecha_referencia:
+            raise ErrorPeticion("'hasta' no puede ser anterior a 'fecha'")
+        rutas = resolver_rutas(campos.get('rutas', []), cliente_id, self.server.rutas_permitidas)
+        if not rutas and not archivos:
+            raise ErrorPeticion("Indicar al menos un archivo o una ruta")
+
+        trabajo = self.cola.crear(cliente_id, fecha_referencia, fecha_hasta)
+        try:
+            entrada = os.path.join(self.cola.directorio_trabajo(trabajo['id']), 'entrada')
+            rutas += guardar_subidos(archivos, entrada, cliente_id)
+            self.cola.encolar(trabajo, rutas)
+        except Exception as e:
+            self.cola.finalizar(trabajo['id'], error=str(e))
+            raise
+        self._responder_json(
+            {'id': trabajo['id'], 'estado': trabajo['estado'], 'url': f"/trabajos/{trabajo['id']}"},
+            HTTPStatus.ACCEPTED
+        )
+
+class ServidorSegmentacion(ThreadingHTTPServer):
+    """Servidor HTTP con un hilo por petición y la cola de trabajos compartida."""
+
+    daemon_threads = True
+
+    def __init__(self, direccion, cola: ColaTrabajos, rutas_permitidas: str = None, silencioso: bool = False):
+        super().__init__(direccion, ManejadorSegmentacion)
+        self.cola = cola
+        self.rutas_permitidas = rutas_permitidas
+        self.silencioso = silencioso
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Servicio HTTP local de segmentación de leads.")
+    parser.add_argument('--host', default='127.0.0.1', help="Dirección de escucha (por defecto solo local)")
+    parser.add_argument('--puerto', type=int, default=8502, help="Puerto de escucha")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos que ejecutan trabajos")
+    parser.add_argument('--max-cola', type=int, default=MAX_COLA, help="Trabajos pendientes admitidos")
+    parser.add_argument('--trabajos', default=None, help="Directorio de archivos de los trabajos")
+    parser.add_argument('--almacen', help="Directorio del almacén incremental de leads (opcional)")
+    parser.add_argument('--rutas-permitidas', help="Directorio desde el que se aceptan rutas de archivos")
+    args = parser.parse_args(argv)
+
+    cola = ColaTrabajos(args.workers, args.max_cola, args.trabajos, args.almacen)
+    servidor = ServidorSegmentacion((args.host, args.puerto), cola, args.rutas_permitidas)
+    print(f"Escuchando en http://{args.host}:{servidor.server_port}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        cola.cerrar()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from config_clientes import DIRECTORIO_DATOS
+from deduplicacion import hash_clave
+
+# Base SQLite con el historial de contactos exportados por cliente, grupo y día
+ARCHIVO_SUPRESION = os.environ.get(
+    'SEGMENTACION_SUPRESION_DB',
+    os.path.join(DIRECTORIO_DATOS, 'supresion.sqlite')
+)
+
+# Clave de contacto usada por defecto (la que marca el call center)
+CLAVE_SUPRESION = 'telefono'
+
+def conectar(ruta: str = None) -> sqlite3.Connection:
+    """Abre la base de supresión y crea el esquema si no existe."""
+    ruta = ruta or ARCHIVO_SUPRESION
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    conexion = sqlite3.connect(ruta, timeout=30)
+    conexion.execute('PRAGMA journal_mode=WAL')
+    # Una fila por contacto y día exportado: un backfill de una fecha anterior ve
+    # las exportaciones de su propio período aunque después haya otras más nuevas
+    conexion.execute(
+        'CREATE TABLE IF NOT EXISTS exportaciones ('
+        ' cliente TEXT NOT NULL, grupo TEXT NOT NULL, clave INTEGER NOT NULL, fecha INTEGER NOT NULL,'
+        ' PRIMARY KEY (cliente, grupo, clave, fecha)) WITHOUT ROWID'
+    )
+    conexion.execute('CREATE INDEX IF NOT EXISTS idx_exportaciones_fecha ON exportaciones (cliente, grupo, fecha)')
+    return conexion
+
+def _claves(df: pd.DataFrame, clave: str) -> pd.Series:
+    """Obtiene las claves de contacto por posición como enteros con signo (admitidos por SQLite)."""
+    columnas = [col for col in ('Tel', 'Email') if col in df.columns]
+    hashes = hash_clave(df[columnas].reset_index(drop=True), clave)
+    return pd.Series(hashes.to_numpy().view('int64'), index=hashes.index)
+
+def filtrar_contactados(df: pd.DataFrame, cliente_id: str, grupo: dict, fecha_referencia,
+                        ruta: str = None):
+    """Quita los leads exportados para el grupo dentro de su período de enfriamiento.
+
+    Se suprimen los contactos exportados en los 'dias_enfriamiento' días
+    anteriores a la fecha de referencia; las exportaciones del mismo día no
+    cuentan, así una nueva ejecución del día devuelve el mismo resultado.
+    Devuelve el DataFrame filtrado y la cantidad de leads suprimidos.
+    """
+    dias = grupo.get('dias_enfriamiento')
+    if not dias or df.empty:
+        return df, 0
+
+    hoy = fecha_referencia.toordinal()
+    claves = _claves(df, grupo.get('clave_supresion', CLAVE_SUPRESION))
+    with conectar(ruta) as conexion:
+        # El índice por fecha acota la lectura a los contactos recientes
+        recientes = np.fromiter(
+            (fila[0] for fila in conexion.execute(
+                'SELECT DISTINCT clave FROM exportaciones WHERE cliente = ? AND grupo = ? AND fecha BETWEEN ? AND ?',
+                (cliente_id, grupo['nombre'], hoy - dias, hoy - 1)
+            )),
+            dtype='int64'
+        )
+    conexion.close()
+
+    suprimidos = claves.index[np.isin(claves.to_numpy(), recientes)]
+    mascara = np.ones(len(df), dtype=bool)
+    mascara[suprimidos] = False
+    return df[mascara], len(suprimidos)
+
+def claves_exportadas(df: pd.DataFrame, grupo: dict) -> np.ndarray:
+    """Obtiene las claves de contacto a registrar para el grupo (vacío si no tiene enfriamiento)."""
+    if not grupo.get('dias_enfriamiento') or df.empty:
+        return np.empty(0, dtype='int64')
+    return _claves(df, grupo.get('clave_supresion', CLAVE_SUPRESION)).unique()
+
+def registrar_claves(claves: np.ndarray, cliente_id: str, grupo: dict, fecha_referencia,
+                     ruta: str = None) -> int:
+    """Registra claves de contacto ya calculadas como exportadas en la fecha de referencia."""
+    if not len(claves):
+        return 0
+
+    hoy = fecha_referencia.toordinal()
+    with conectar(ruta) as conexion:
+        conexion.executemany(
+            'INSERT OR IGNORE INTO exportaciones (cliente, grupo, clave, fecha) VALUES (?, ?, ?, ?)',
+            ((cliente_id, grupo['nombre'], int(clave), hoy) for clave in claves)
+        )
+    conexion.close()
+    return len(claves)
+
+def registrar_exportados(df: pd.DataFrame, cliente_id: str, grupo: dict, fecha_referencia,
+                         ruta: str = None) -> int:
+    """Registra los contactos exportados por el grupo en la fecha de referencia."""
+    return registrar_claves(claves_exportadas(df, grupo), cliente_id, grupo, fecha_referencia, ruta)
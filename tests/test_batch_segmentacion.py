@@ -0,0 +1,32 @@
+from datetime import date
+
+import pytest
+
+import fechas
+import supresion
+from batch_segmentacion import segmentar_cliente
+from benchmark_segmentacion import generar_leads
+
+FECHA = date(2026, 3, 10)
+
+
+@pytest.fixture
+def entrada(tmp_path, monkeypatch):
+    monkeypatch.setattr(supresion, 'ARCHIVO_SUPRESION', str(tmp_path / 'supresion.sqlite'))
+    monkeypatch.setattr(fechas, 'ARCHIVO_FORMATOS', str(tmp_path / 'formatos_fecha.json'))
+    directorio = tmp_path / 'PK_CBA'
+    directorio.mkdir()
+    for semilla in range(2):
+        generar_leads('PK_CBA', 3000, FECHA, semilla).to_csv(directorio / f'leads_{semilla}.csv', index=False)
+    return directorio
+
+
+def test_bloques_y_memoria_dan_el_mismo_resumen(entrada, tmp_path):
+    en_memoria = segmentar_cliente('PK_CBA', str(entrada), FECHA, str(tmp_path / 'memoria'))
+    por_bloques = segmentar_cliente('PK_CBA', str(entrada), FECHA, str(tmp_path / 'bloques'), tamano_bloque=700)
+
+    assert en_memoria['error'] is None and por_bloques['error'] is None
+    assert en_memoria['fechas_invalidas'] > 0
+    assert en_memoria['programas_sin_codigo']
+    for campo in ('leads', 'fechas_invalidas', 'grupos', 'programas_sin_codigo'):
+        assert en_memoria[campo] == por_bloques[campo], campo
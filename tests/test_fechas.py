@@ -0,0 +1,17 @@
+import pandas as pd
+
+from fechas import parsear_fechas
+
+
+def test_desplazamiento_negativo_de_noche_conserva_el_dia():
+    serie = pd.Series(['2024-03-05 22:00-05:00', '2024-03-05T23:30:00+02:00', '05/03/2024 10:00'])
+    resultado = parsear_fechas(serie)
+    assert resultado.dtype == 'datetime64[ns]'
+    assert list(resultado) == [
+        pd.Timestamp('2024-03-05 22:00'), pd.Timestamp('2024-03-05 23:30'), pd.Timestamp('2024-03-05 10:00')
+    ]
+
+
+def test_columna_con_zona_conserva_la_hora_local():
+    serie = pd.Series(pd.to_datetime(['2024-03-05 22:00']).tz_localize('America/Bogota'))
+    assert parsear_fechas(serie).iloc[0] == pd.Timestamp('2024-03-05 22:00')
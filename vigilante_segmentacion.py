@@ -0,0 +1,230 @@
+"""Vigila las carpetas donde el CRM deja los exports y segmenta los archivos nuevos.
+
+Cada archivo nuevo o modificado se incorpora al almacén incremental y se
+vuelven a generar los grupos del cliente para la fecha de hoy. Un archivo se
+procesa recién cuando su tamaño y fecha de modificación no cambian durante
+--espera segundos (el CRM puede estar escribiéndolo). Los archivos procesados
+quedan en un manifiesto, así un reinicio no vuelve a procesarlos. El almacén
+va junto al manifiesto (SALIDA/.almacen por defecto): el manifiesto solo sirve
+con el almacén que tiene esos archivos, así que no se arranca si el manifiesto
+tiene archivos procesados y el almacén no existe.
+
+Ejemplo:
+    python vigilante_segmentacion.py --base /compartido/crm --salida /compartido/segmentos
+    python vigilante_segmentacion.py --entrada CREXE=/compartido/crexe --intervalo 30 --espera 20
+    python vigilante_segmentacion.py --base /compartido/crm --una-vez
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+from batch_segmentacion import listar_archivos, parsear_entradas, segmentar_cliente
+from cache_archivos import hash_contenido
+
+# Segundos entre revisiones de las carpetas
+INTERVALO_REVISION = 60
+# Segundos sin cambios de tamaño ni fecha para considerar que un archivo terminó de escribirse
+ESPERA_ESTABLE = 30
+# Nombre del manifiesto dentro del directorio de salida
+NOMBRE_MANIFIESTO = '.manifiesto_vigilante.json'
+# Nombre del almacén incremental, en el mismo directorio que el manifiesto
+NOMBRE_ALMACEN = '.almacen'
+
+def es_temporal(ruta: str) -> bool:
+    """Indica si el archivo es un temporal o bloqueo (~$ de Excel, ocultos)."""
+    nombre = os.path.basename(ruta)
+    return nombre.startswith(('~$', '.'))
+
+def cargar_manifiesto(ruta: str) -> dict:
+    """Carga el manifiesto de archivos procesados (vacío si no existe o está dañado)."""
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f).get('archivos', {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+def guardar_manifiesto(archivos: dict, ruta: str):
+    """Guarda el manifiesto de forma atómica."""
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump({'archivos': archivos}, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta)
+
+class Vigilante:
+    """Detecta los archivos nuevos de cada cliente y los segmenta al quedar estables."""
+
+    def __init__(self, directorios: dict, directorio_salida: str, directorio_almacen: str = None,
+                 ruta_manifiesto: str = None, espera: float = ESPERA_ESTABLE):
+        self.directorios = directorios
+        self.directorio_salida = directorio_salida
+        self.ruta_manifiesto = ruta_manifiesto or os.path.join(directorio_salida, NOMBRE_MANIFIESTO)
+        self.manifiesto = cargar_manifiesto(self.ruta_manifiesto)
+        self.directorio_almacen = directorio_almacen or \
+            os.path.join(os.path.dirname(self.ruta_manifiesto), NOMBRE_ALMACEN)
+        # Sin el almacén, los archivos del manifiesto no se volverían a leer y faltarían en los grupos
+        procesados = any(registro.get('error') is None for registro in self.manifiesto.values())
+        if procesados and not os.path.isdir(self.directorio_almacen):
+            raise FileNotFoundError(
+                f"El manifiesto {self.ruta_manifiesto} existe pero el almacén {self.directorio_almacen} no; "
+                f"indicar el --almacen correcto o borrar el manifiesto para reprocesar todo"
+            )
+        self.espera = espera
+        # Ruta -> (tamaño, fecha de modificación, momento desde el que no cambian)
+        self._observados = {}
+
+    def _estable(self, ruta: str, estado: os.stat_result, ahora: float) -> bool:
+        """Registra la observación y dice si el archivo lleva 'espera' segundos sin cambios."""
+        firma = (estado.st_size, estado.st_mtime_ns)
+        anterior = self._observados.get(ruta)
+        if anterior is None or anterior[:2] != firma:
+            self._observados[ruta] = (*firma, ahora)
+            return False
+        return ahora - anterior[2] >= self.espera
+
+    def pendientes(self, cliente_id: str) -> list:
+        """Obtiene los archivos nuevos o modificados del cliente que ya terminaron de escribirse."""
+        ahora = time.monotonic()
+        listos = []
+        for ruta in listar_archivos(self.directorios[cliente_id], cliente_id):
+            if es_temporal(ruta):
+                continue
+            ruta = os.path.abspath(ruta)
+            try:
+                estado = os.stat(ruta)
+                registro = self.manifiesto.get(ruta)
+                if registro and (registro['tamano'], registro['mtime_ns']) == (estado.st_size, estado.st_mtime_ns):
+                    continue
+                if not self._estable(ruta, estado, ahora):
+                    continue
+                # La fecha cambió pero el contenido no (p. ej. el CRM volvió a copiar el mismo export)
+                hash_archivo = hash_contenido(ruta)
+            except OSError:
+                # Borrado o renombrado mientras se revisaba
+                self._observados.pop(ruta, None)
+                continue
+            if registro and registro['hash'] == hash_archivo:
+                registro.update(tamano=estado.st_size, mtime_ns=estado.st_mtime_ns)
+                continue
+            listos.append((ruta, estado, hash_archivo))
+        return listos
+
+    def _registrar(self, cliente_id: str, listos: list, error: str = None):
+        """Anota los archivos en el manifiesto; uno con error se reintenta solo si cambia."""
+        for ruta, estado, hash_archivo in listos:
+            self._observados.pop(ruta, None)
+            self.manifiesto[ruta] = {
+                'cliente': cliente_id,
+                'tamano': estado.st_size,
+                'mtime_ns': estado.st_mtime_ns,
+                'hash': hash_archivo,
+                'procesado': datetime.now().isoformat(timespec='seconds'),
+                'error': error,
+            }
+        # El almacén existe desde el primer manifiesto, aunque el archivo no haya aportado leads
+        os.makedirs(self.directorio_almacen, exist_ok=True)
+        guardar_manifiesto(self.manifiesto, self.ruta_manifiesto)
+
+    def _segmentar(self, cliente_id: str, listos: list, fecha_referencia) -> dict:
+        rutas = [ruta for ruta, _, _ in listos]
+        resumen = segmentar_cliente(
+            cliente_id, self.directorios[cliente_id], fecha_referencia,
+            os.path.join(self.directorio_salida, cliente_id), self.directorio_almacen, archivos=rutas
+        )
+        resumen['archivos_nuevos'] = [os.path.basename(ruta) for ruta in rutas]
+        return resumen
+
+    def procesar(self, cliente_id: str, listos: list, fecha_referencia) -> list:
+        """Segmenta los archivos nuevos del cliente y devuelve los resúmenes de cada ejecución.
+
+        Si la ejecución conjunta falla, los archivos se reprocesan de a uno
+        para que un archivo dañado no bloquee a los demás.
+        """
+        resumen = self._segmentar(cliente_id, listos, fecha_referencia)
+        if not resumen['error'] or len(listos) == 1:
+            self._registrar(cliente_id, listos, resumen['error'])
+            return [resumen]
+
+        resumenes = []
+        for archivo in listos:
+            resumen = self._segmentar(cliente_id, [archivo], fecha_referencia)
+            self._registrar(cliente_id, [archivo], resumen['error'])
+            resumenes.append(resumen)
+        return resumenes
+
+    def revisar(self) -> list:
+        """Revisa todas las carpetas una vez y procesa lo que esté listo."""
+        fecha_referencia = datetime.now().date()
+        resumenes = []
+        for cliente_id in self.directorios:
+            listos = self.pendientes(cliente_id)
+            if listos:
+                resumenes += self.procesar(cliente_id, listos, fecha_referencia)
+        return resumenes
+
+def imprimir_resumen(resumen: dict):
+    estado = f"ERROR: {resumen['error']}" if resumen['error'] else \
+        ', '.join(f"{nombre}={n}" for nombre, n in resumen['grupos'].items())
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {resumen['cliente']:<8} {resumen['segundos']:8.2f}s  "
+          f"{', '.join(resumen['archivos_nuevos'])}: {resumen['leads']} leads, "
+          f"{resumen['fechas_invalidas']} omitidos por fecha  {estado}", flush=True)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Segmenta automáticamente los exports nuevos del CRM.")
+    parser.add_argument('--base', help="Directorio con una subcarpeta por cliente (CREXE/, UNAB/, ...)")
+    parser.add_argument('--entrada', action='append', default=[], metavar='CLIENTE=DIR',
+                        help="Carpeta vigilada de un cliente; se puede repetir")
+    parser.add_argument('--salida', default='salida', help="Directorio de salida de los grupos")
+    parser.add_argument('--almacen', help=f"Directorio del almacén incremental de leads "
+                                          f"(por defecto {NOMBRE_ALMACEN} junto al manifiesto)")
+    parser.add_argument('--manifiesto', help=f"Manifiesto de archivos procesados (por defecto SALIDA/{NOMBRE_MANIFIESTO})")
+    parser.add_argument('--intervalo', type=float, default=INTERVALO_REVISION, help="Segundos entre revisiones")
+    parser.add_argument('--espera', type=float, default=ESPERA_ESTABLE,
+                        help="Segundos sin cambios para dar por terminado un archivo")
+    parser.add_argument('--una-vez', action='store_true',
+                        help="Revisar una sola vez (esperando --espera) y terminar")
+    args = parser.parse_args(argv)
+
+    try:
+        directorios = parsear_entradas(args.entrada, args.base)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if not directorios:
+        parser.error("Indicar --base o al menos una --entrada")
+    if args.intervalo <= 0 or args.espera < 0:
+        parser.error("--intervalo debe ser mayor que cero y --espera no puede ser negativa")
+
+    try:
+        vigilante = Vigilante(directorios, args.salida, args.almacen, args.manifiesto, args.espera)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    detener = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: detener.set())
+
+    clientes = ', '.join(f"{cliente_id}={directorio}" for cliente_id, directorio in directorios.items())
+    print(f"Vigilando {clientes}", flush=True)
+    try:
+        if args.una_vez:
+            # La primera revisión registra los archivos; la segunda procesa los que no cambiaron
+            vigilante.revisar()
+            detener.wait(args.espera)
+            for resumen in vigilante.revisar():
+                imprimir_resumen(resumen)
+            return 0
+        while not detener.is_set():
+            for resumen in vigilante.revisar():
+                imprimir_resumen(resumen)
+            detener.wait(args.intervalo)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())